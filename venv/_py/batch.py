@@ -0,0 +1,103 @@
+# Batch analysis of FEN/EPD files, fanned out over a process pool with results streamed back in order
+import argparse
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from fen import PositionCache
+from position import move_name
+from search import Search
+
+# one Search and position cache per worker process, so both carry over between positions
+_search = None
+_cache = None
+
+
+def init_worker(megabytes, cachesize):
+    """Set up a worker process. """
+    global _search, _cache
+    _search = Search(megabytes)
+    _cache = PositionCache(cachesize)
+
+
+def read_position(line):
+    """Turn a FEN or EPD line into a full FEN, filling in the move counters EPD leaves out. """
+    fields = line.split()
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        return ' '.join(fields[:6])
+    if len(fields) >= 4:
+        return ' '.join(fields[:4]) + ' 0 1'  # anything after the fourth field is an EPD operation
+    return line.strip()  # parse_FEN pads a bare placement and says what is wrong with anything else
+
+
+def analyse_line(line, depth=None, movetime=None, nodes=None):
+    """Return the tab separated result for one input line: line, legal move count, best move, error. """
+    line = line.strip()
+    try:
+        position = _cache.get(read_position(line))
+    except ValueError as e:
+        return f'{line}\t\t\t{e}'
+
+    moves = position.legal_moves()
+    best = ''
+    if moves and (depth or movetime or nodes):
+        best = move_name(_search.search(position, depth, movetime, nodes))
+    return f'{line}\t{len(moves)}\t{best}\t'
+
+
+def analyse_chunk(lines, depth, movetime, nodes):
+    """Analyse a chunk of lines inside a worker process. """
+    return [analyse_line(line, depth, movetime, nodes) for line in lines]
+
+
+def analyse(lines, workers=None, chunksize=64, depth=None, movetime=None, nodes=None, megabytes=16, cachesize=4096):
+    """Yield one result per non-blank input line, in input order.
+
+        Lines are read lazily and only a couple of chunks per worker are in flight at once,
+        so memory stays flat however long the input is.
+    """
+    workers = workers or os.cpu_count() or 1
+    lines = (line for line in lines if line.strip())
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(megabytes, cachesize)) as pool:
+        pending = deque()
+        while True:
+            chunk = list(islice(lines, chunksize))
+            if not chunk: break
+            pending.append(pool.submit(analyse_chunk, chunk, depth, movetime, nodes))
+
+            # wait on the oldest chunk once enough are queued, which keeps the output in input order
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Analyse a file of FEN/EPD positions, one per line.')
+    parser.add_argument('file', nargs='?', default='-', help='input file, - or nothing for stdin')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per core)')
+    parser.add_argument('--chunksize', type=int, default=64, help='positions sent to a worker at a time (default 64)')
+    parser.add_argument('--depth', type=int, help='search to this depth for a best move')
+    parser.add_argument('--movetime', type=float, help='search this many seconds per position for a best move')
+    parser.add_argument('--nodes', type=int, help='search this many nodes per position for a best move')
+    parser.add_argument('--hash', type=int, default=16, help='transposition table megabytes per worker (default 16)')
+    parser.add_argument('--cache', type=int, default=4096,
+                        help='positions each worker keeps parsed for repeated FENs, 0 disables it (default 4096)')
+    args = parser.parse_args(argv)
+
+    infile = sys.stdin if args.file == '-' else open(args.file)
+    try:
+        for result in analyse(infile, args.workers, args.chunksize, args.depth, args.movetime, args.nodes,
+                              args.hash, args.cache):
+            print(result)
+    finally:
+        if infile is not sys.stdin: infile.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# Non-interactive benchmark: perft node counts against reference values, throughput and profiles
+import argparse
+import cProfile
+import pstats
+import sys
+from time import perf_counter
+
+from board import Board
+from fen import write_FEN
+
+# name, FEN, reference perft counts for depth 1, 2, 3...
+# counts from https://www.chessprogramming.org/Perft_Results, middlegame cross-checked against python-chess
+POSITIONS = (
+    ('start', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     (20, 400, 8902, 197281, 4865609)),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     (48, 2039, 97862, 4085603)),
+    ('en passant', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     (14, 191, 2812, 43238, 674624)),
+    ('promotion', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     (6, 264, 9467, 422333)),
+    ('castling', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     (44, 1486, 62379, 2103487)),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P3/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     (47, 1845, 81467, 3065277)),
+)
+
+# name, FEN, expected status. perft plays out every legal move, so it never notices a position left
+# changed by a caller that only asks whether there is one, like status does
+STATUS_POSITIONS = (
+    ('en passant only', '8/8/8/8/3Pp3/4B3/5K2/5N1k b - d3 0 1', 'CONTINUE'),
+    ('checkmate', 'rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3', 'CHECKMATE'),
+    ('stalemate', '7k/5Q2/6K1/8/8/8/8/8 b - - 0 1', 'STALEMATE'),
+)
+
+# the position the old timing loop in main.py used
+VIEW_FEN = 'r1bq1b1r/2p1k1pp/2Bp4/p3Pp2/4n1Q1/2N5/PPP2PPP/R1B1K2R w KQ - 1 11'
+
+# functions worth seeing in the profile output
+PROFILE_FILTER = 'get_legal_moves|legal_moves_helper|pseudo_moves|_pawn_moves|_castle_moves|legal_moves|attack_map|pins|make_move|perft'
+
+
+def perft(position, depth):
+    """Count the leaf nodes of the legal move tree below a position. """
+    if depth == 0: return 1
+
+    moves = position.legal_moves()
+    if depth == 1: return len(moves)  # bulk count, the leaves don't need playing
+
+    nodes = 0
+    for move in moves:
+        position.make_move(move)
+        nodes += perft(position, depth - 1)
+        position.unmake_move()
+    return nodes
+
+
+def run_perft(depth, names=None):
+    """Run perft over the standard positions and print one line per position. Return True if every count matched. """
+    passed = True
+    total_nodes = 0
+    total_time = 0
+
+    for name, FEN, expected in POSITIONS:
+        if names and name not in names: continue
+        position = Board(FEN).position
+        reference = expected[depth - 1] if depth <= len(expected) else None
+
+        t = perf_counter()
+        nodes = perft(position, depth)
+        elap = perf_counter() - t
+        total_nodes += nodes
+        total_time += elap
+
+        if reference is None: status = 'no reference'
+        elif nodes == reference: status = 'ok'
+        else:
+            status = f'FAIL, expected {reference}'
+            passed = False
+        print(f'{name:<12} depth {depth}  {nodes:>10} nodes  {elap * 1000:>10.1f} ms  {nodes / elap:>10.0f} nps  {status}')
+
+    if total_time:
+        print(f'{"total":<12} depth {depth}  {total_nodes:>10} nodes  {total_time * 1000:>10.1f} ms  '
+              f'{total_nodes / total_time:>10.0f} nps')
+    return passed
+
+
+def run_status():
+    """Check status on the terminal detection positions and that it leaves them as they were. Return True if all passed. """
+    passed = True
+    for name, FEN, expected in STATUS_POSITIONS:
+        position = Board(FEN).position
+        before = write_FEN(position)
+        status = position.status()
+        after = write_FEN(position)
+
+        if status != expected: result = f'FAIL, expected {expected}'
+        elif after != before: result = f'FAIL, position changed to {after}'
+        else: result = 'ok'
+        passed = passed and result == 'ok'
+        print(f'{name:<16} {status:<10} {result}')
+    return passed
+
+
+def run_view(cycles, rounds):
+    """Time all_moves_on_board and the Piece view generators, like the old loop in main.py did. """
+    board = Board(VIEW_FEN)
+    pieces = [piece for piece, pos, moves in board.all_moves_on_board()]
+    view = board.board
+
+    for label, func in (('all_moves_on_board', board.all_moves_on_board),
+                        ('Piece.get_legal_moves', lambda: [piece.get_legal_moves(view) for piece in pieces])):
+        tottime = 0
+        for n in range(rounds):
+            t = perf_counter()
+            for m in range(cycles):
+                func()
+            tottime += perf_counter() - t
+        print(f'{label:<22} {cycles} cycles  {tottime * 1000 / rounds:>10.1f} ms per round')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check perft counts and measure move generation throughput.')
+    parser.add_argument('--depth', type=int, default=3, help='perft depth (default 3)')
+    parser.add_argument('--position', action='append', dest='names',
+                        help='only run the named position, may be repeated: ' + ', '.join(p[0] for p in POSITIONS))
+    parser.add_argument('--cycles', type=int, default=2000, help='cycles per round for the view timing (default 2000)')
+    parser.add_argument('--rounds', type=int, default=5, help='rounds for the view timing, 0 skips it (default 5)')
+    parser.add_argument('--profile', metavar='FILE', help='write cProfile stats to FILE and print the move generators')
+    args = parser.parse_args(argv)
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler: profiler.enable()
+
+    passed = run_perft(args.depth, args.names)
+    passed = run_status() and passed
+    if args.rounds: run_view(args.cycles, args.rounds)
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        pstats.Stats(args.profile).sort_stats('tottime').print_stats(PROFILE_FILTER)
+
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# Board class controls board layout, where pieces are on board
+from pieces import *
+from position import *
+from fen import parse_FEN, write_FEN
+from record import Game, export_pgn
+from math import floor
+
+class Board:
+    """Create an 8x8 chessboard and control inputs and outputs.
+
+        # 8 [00] [01] [02] [03] [04] [05] [06] [07]
+        # 7 [08] [09] [10] [11] [12] [13] [14] [15]
+        # 6 [16] [17] [18] [19] [20] [21] [22] [23]
+        # 5 [24] [25] [26] [27] [28] [29] [30] [31]
+        # 4 [32] [33] [34] [35] [36] [37] [38] [39]
+        # 3 [40] [41] [42] [43] [44] [45] [46] [47]
+        # 2 [48] [49] [50] [51] [52] [53] [54] [55]
+        # 1 [56] [57] [58] [59] [60] [61] [62] [63]
+        #    a    b    c    d    e    f    g    h
+    """
+
+    # used to build the Piece view of the board from Position piece codes
+    piece_classes = {PAWN: Pawn, KNIGHT: Knight, BISHOP: Bishop, ROOK: Rook, QUEEN: Queen, KING: King}
+
+    def __init__(self, FEN=None, cache=None, writer=None):
+        # the position is the real board, self.board is a list of Pieces built from it on demand
+        self.position = Position()
+        self.position.castle = CASTLE_K | CASTLE_Q | CASTLE_k | CASTLE_q
+        self.position.key = self.position.compute_key()
+        self.view = None
+        self.viewkey = None  # key of the position the view was built from
+        self.gamestring = ''
+
+        # compact record of the game, and optionally a record.GameWriter that every registered move goes to
+        self.game = Game(self.get_FEN())
+        self.writer = writer
+
+        if FEN:
+            self.read_FEN(FEN, cache)
+
+    @property
+    def board(self):
+        """Return the board as a list of Pieces, with checker ints on empty squares. """
+        # keyed on the zobrist hash, so a move played and taken back straight on the position is fine too
+        if self.view is None or self.viewkey != self.position.key:
+            self.view = self.checker([self.make_piece(n) for n in range(64)])
+            self.viewkey = self.position.key
+        return self.view
+
+    def make_piece(self, pos):
+        """Build the Piece standing on a square of the position, or None if it is empty. """
+        code = self.position.squares[pos]
+        if not code: return None
+
+        color = 'b' if code & BLACKBIT else 'w'
+        piece = self.piece_classes[code & 7](pos, color)
+        if isinstance(piece, King):
+            piece.update_castle_rights(self.castle)
+        elif isinstance(piece, Pawn) and self.position.ep >= 0 and (code >> 3) == self.position.tomove:
+            if self.position.ep in PAWN_SQUARES[code >> 3][pos]: piece.passant = self.position.ep
+        return piece
+
+    # all used for FEN strings and rule calculations, stored compactly in the position
+    @property
+    def tomove(self):
+        return 'b' if self.position.tomove else 'w'
+
+    @property
+    def castle(self):
+        return ''.join(tag for bit, tag in CASTLE_TAGS if self.position.castle & bit) or '-'
+
+    @property
+    def passant(self):
+        return '-' if self.position.ep < 0 else self.reverse_pos(self.position.ep)
+
+    @property
+    def halfmoves(self):
+        return self.position.halfmoves
+
+    @property
+    def fullmoves(self):
+        return self.position.fullmoves
+
+    def all_moves_on_board(self):
+        """Get every legal move on the board. """
+        # this method for testing purposes only!
+        position = self.position
+        targets = {n: [] for n, code in enumerate(position.squares) if code}
+        for move in position.pseudo_moves(WHITE) + position.pseudo_moves(BLACK):
+            if move < 4096: targets[move & 63].append(move >> 6)
+            # a promotion comes once per piece, only the queen's is kept so every target is listed once
+            elif move >> 12 == QUEEN: targets[move & 63].append((move >> 6) & 63)
+
+        board = self.board
+        return [(board[n], n, moves) for n, moves in targets.items()]
+
+    def read_move(self, move, color):
+        """Read a user inputted move, in custom program format. """
+        # in format "mov a1 a2": move piece at a1 square to a2
+        move = move.split(' ')
+        origin = self.get_pos(move[1])
+        to = self.get_pos(move[2])
+
+        assert isinstance(self.board[origin], Piece), 'Not a piece!'
+        assert color.lower().startswith(self.board[origin].color), 'Wrong color piece!'
+        assert to in self.position.moves_from(origin), 'Illegal move!'
+
+        status = self.register_move((origin, to))
+        self.print_board(self.board)
+        print(f'Moved {self.board[to].name} to {self.reverse_pos(to)}')
+        return status
+
+    def register_move(self, move):
+        """Register a certain input move and process its consequences. """
+        position = self.position
+        name = PIECE_NAMES[position.squares[move[0]] & 7]
+        if position.tomove == BLACK:
+            self.gamestring += f'Black: {name} to {self.reverse_pos(move[1])}\n'
+        else:
+            self.gamestring += f'{position.fullmoves}:  White: {name} to {self.reverse_pos(move[1])}, '
+
+        encoded = self.make_move(move)
+        self.game.moves.append(encoded)
+        if self.writer: self.writer.append(encoded)
+
+        # deal with win/draw conditions now the move is on the board. moves are legal, so no one can lose on their own move
+        status = position.status()
+        if status == "CHECKMATE":
+            self.finish_game('0-1' if position.tomove == WHITE else '1-0')
+            return "WIN"
+        if status in ("STALEMATE", "FIFTY"):
+            self.finish_game('1/2-1/2')
+            return "DRAW"
+        return "CONTINUE"
+
+    def finish_game(self, result):
+        """Set the result of the game and write it out if it is being recorded. """
+        self.game.result = result
+        if self.writer: self.writer.finish(result)
+
+    def get_PGN(self):
+        """Return the game so far as PGN text. """
+        return export_pgn(self.game)
+
+    def make_move(self, move):
+        """Play a move given as (origin, to) or (origin, to, promotion kind) on the board. Return it encoded. """
+        promo = move[2] if len(move) > 2 else 0
+        # make this prompt the user later on
+        if not promo and self.position.squares[move[0]] & 7 == PAWN and floor(move[1] / 8) in (0, 7):
+            promo = QUEEN
+
+        encoded = encode_move(move[0], move[1], promo)
+        self.position.make_move(encoded)
+        self.view = None
+        return encoded
+
+    def unmake_move(self):
+        """Take back the last move played on the board. """
+        self.position.unmake_move()
+        self.view = None
+
+    def read_FEN(self, FEN, cache=None):
+        """Take an input FEN string and convert the board to that position. """
+        # a cache hands out a ready-built copy for FENs it has seen before
+        self.position = cache.get(FEN) if cache else parse_FEN(FEN)
+        self.view = None
+
+        # a new position starts a new game
+        self.game = Game(self.get_FEN())
+        if self.writer: self.writer.begin(self.game.FEN)
+
+    def get_FEN(self):
+        """Return a FEN string created from board at time of call. """
+        return write_FEN(self.position)
+
+    @staticmethod
+    def checker(board):
+        """Checker the board. """
+        for n in range(8):
+            for m in range(8):
+                if isinstance(board[(n*8) + m], Piece): continue
+                board[(n*8) + m] = (n+m) % 2
+        return board
+
+    @staticmethod
+    def print_board(board):
+        """Print the board with Pieces as tags. """
+        print('\n' * 100)
+
+        board = Board.checker(board)  # just in case any captures have messed it up
+
+        for n in range(8):
+            printout = []
+            for m in range(8):
+                if isinstance(board[(n*8) + m], Piece):
+                    printout.append(board[(n*8) + m].tag)
+                else:
+                    printout.append(str(board[(n*8) + m]))  # str to make it same width as tags
+            print(f'{8-n} {printout}')
+
+        print('    ', end = '')
+        for n in range(8):
+            print(f'{chr(n+97)}    ', end = '')
+        print()
+
+    @staticmethod
+    def get_pos(str):
+        """Get the absolute list position from a given chess coordinate. """
+        return ((8 - int(str[1])) * 8) + (ord(str[0]) - 97)
+
+    @staticmethod
+    def reverse_pos(pos):
+        """Get a chess coordinate from a given absolute position. """
+        num = 8 - int(floor(pos/8))  # 1-8
+        char = chr((pos - (8 * (8 - num))) + 97)  # a-h
+        return f'{char}{num}'
+    
\ No newline at end of file
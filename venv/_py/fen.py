@@ -0,0 +1,138 @@
+# FEN codec: validate and parse in a single pass, serialize with joins, cache built positions
+from collections import OrderedDict
+
+from position import *
+
+DEFAULT_FIELDS = ('w', '-', '-', '0', '1')  # what a bare piece placement is padded with
+SQUARE_INDEX = {name: n for n, name in enumerate(SQUARE_NAMES)}
+CASTLE_BITS = {tag: bit for bit, tag in CASTLE_TAGS}
+CASTLE_STRINGS = [''.join(tag for bit, tag in CASTLE_TAGS if n & bit) or '-' for n in range(16)]
+EMPTY_RUNS = '012345678'
+
+
+def parse_FEN(FEN):
+    """Build a Position from a FEN string, raising ValueError with validate_FEN's message if it is invalid. """
+    fields = FEN.split()
+    if not fields or fields[0].count('/') != 7: raise ValueError('Invalid Body Format')
+    if len(fields) == 1: fields.extend(DEFAULT_FIELDS)
+    elif len(fields) != 6: raise ValueError('Invalid Segment Count')
+    body, tomove, castle, ep, halfmoves, fullmoves = fields
+
+    position = Position()
+    squares, bb = position.squares, position.bb
+    index = 0
+    rowend = 8
+    key = 0  # the zobrist key is built along the way instead of with another pass over the squares
+    for c in body:
+        code = PIECE_CODES.get(c)
+        if code:
+            if index >= rowend: raise ValueError('Invalid Empty Square Count')
+            squares[index] = code
+            bb[code] |= 1 << index
+            key ^= ZOBRIST_PIECES[code][index]
+            index += 1
+        elif c == '/':
+            if index != rowend: raise ValueError('Invalid Empty Square Count')
+            rowend += 8
+        elif '1' <= c <= '8':
+            index += ord(c) - 48
+            if index > rowend: raise ValueError('Invalid Empty Square Count')
+        else:
+            raise ValueError('Invalid Main Segment')
+    if index != 64: raise ValueError('Invalid Empty Square Count')
+
+    position.occ[WHITE] = bb[PAWN] | bb[KNIGHT] | bb[BISHOP] | bb[ROOK] | bb[QUEEN] | bb[KING]
+    position.occ[BLACK] = bb[PAWN | BLACKBIT] | bb[KNIGHT | BLACKBIT] | bb[BISHOP | BLACKBIT] \
+        | bb[ROOK | BLACKBIT] | bb[QUEEN | BLACKBIT] | bb[KING | BLACKBIT]
+
+    tomove = tomove.lower()
+    if tomove not in ('w', 'b'): raise ValueError('Invalid Tomove Segment')
+    position.tomove = BLACK if tomove == 'b' else WHITE
+
+    if castle != '-':
+        for c in castle:
+            bit = CASTLE_BITS.get(c, 0)
+            if not bit or position.castle & bit: raise ValueError('Invalid Castling Segment')
+            position.castle |= bit
+
+    if ep != '-':
+        ep = SQUARE_INDEX.get(ep, -1)
+        us = position.tomove
+        # the square a pawn just skipped: on rank 6 or 3, empty, with the pawn that pushed right in front
+        front = ep + 8 if us == WHITE else ep - 8
+        if not (16 <= ep < 24 if us == WHITE else 40 <= ep < 48) or squares[ep] \
+                or squares[front] != PAWN | (us ^ 1) << 3:
+            raise ValueError('Invalid En Passant Segment')
+        # only kept when a pawn can take, like make_move does, so the key matches however the position was reached
+        if PAWN_ATTACKS[us ^ 1][ep] & bb[PAWN | us << 3]: position.ep = ep
+
+    if not halfmoves.isdigit(): raise ValueError('Invalid Halfmove Segment')
+    if not fullmoves.isdigit(): raise ValueError('Invalid Fullmove Segment')
+    position.halfmoves = int(halfmoves)
+    position.fullmoves = int(fullmoves)
+
+    key ^= ZOBRIST_CASTLE[position.castle]
+    if position.ep >= 0: key ^= ZOBRIST_EP[position.ep & 7]
+    if position.tomove == BLACK: key ^= ZOBRIST_SIDE
+    position.key = key
+    return position
+
+
+def write_FEN(position):
+    """Return the FEN string of a position. """
+    squares = position.squares
+    rows = []
+    for start in range(0, 64, 8):
+        row = []
+        empty = 0
+        for code in squares[start:start + 8]:
+            if code:
+                # dump the empty run down before the piece tag i.e. n3b1p
+                if empty:
+                    row.append(EMPTY_RUNS[empty])
+                    empty = 0
+                row.append(PIECE_TAGS[code])
+            else:
+                empty += 1
+        if empty: row.append(EMPTY_RUNS[empty])
+        rows.append(''.join(row))
+
+    return ' '.join(('/'.join(rows), 'b' if position.tomove else 'w', CASTLE_STRINGS[position.castle],
+                     SQUARE_NAMES[position.ep] if position.ep >= 0 else '-',
+                     str(position.halfmoves), str(position.fullmoves)))
+
+
+class PositionCache:
+    """Hand out positions built from FEN strings, keeping the most recently used ones ready.
+
+        Holds at most size positions and evicts the least recently used one when full. Every
+        get returns a copy, so callers can play moves on it without touching the cache.
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self.positions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, FEN):
+        """Return a Position for a FEN string. Raises ValueError like parse_FEN, invalid FENs are not cached. """
+        position = self.positions.get(FEN)
+        if position is not None:
+            self.hits += 1
+            self.positions.move_to_end(FEN)
+            return position.copy()
+
+        self.misses += 1
+        position = parse_FEN(FEN)
+        if self.size > 0:
+            self.positions[FEN] = position
+            if len(self.positions) > self.size: self.positions.popitem(last=False)
+            return position.copy()
+        return position
+
+    def clear(self):
+        """Drop every cached position and reset the counters. """
+        self.positions.clear()
+        self.hits = 0
+        self.misses = 0
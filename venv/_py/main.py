@@ -0,0 +1,140 @@
+import sys
+
+import uci
+from board import Board
+from fen import parse_FEN
+from position import move_from, move_to, move_promo
+from probe import Probe
+from search import Search
+
+ENGINE_MOVETIME = 2  # seconds the engine thinks per move
+
+def play(FEN):
+    board = Board(FEN)
+    board.print_board(board.board)
+    cmd = ["HELP", "FEN", "STR", "PGN", "GET"]
+    status = "ERROR"  # if it's not updated there is an error
+    engine, probe, oppcolor = None, None, None
+    print('Play against the engine? y/n')
+    if input().lower().startswith('y'):
+        playercolor, oppcolor = get_colors()
+        engine = Search()
+        probe = Probe()
+    gamecolor = 'White' if board.tomove.startswith('w') else 'Black'
+
+    # a game can be over before anyone moves, then neither the player nor the engine has a move to make
+    start = board.position.status()
+    if start == "CHECKMATE":
+        status, gamecolor = "WIN", opposite_color(gamecolor)  # the side to move is already mated
+    elif start != "CONTINUE":
+        status = "DRAW"
+    else:
+        print(f'{gamecolor} to move.')
+
+    # i think it looks nicer than True
+    while start == "CONTINUE":
+        try:
+            if gamecolor == oppcolor:
+                status = engine_move(board, engine, probe)
+            else:
+                move = input(f"{gamecolor}'s move: ").strip().lower()
+                if move.upper() in cmd:
+                    parse_command(move, board)
+                    continue
+                if 'quit' in move: quit()
+
+                status = board.read_move(move, gamecolor)
+            if status != "CONTINUE": break
+            gamecolor = opposite_color(gamecolor)
+        except AssertionError as e:
+            print(e)
+
+    if not status == "ERROR":
+        print(f'Checkmate! {gamecolor} wins!' if status == "WIN" else 'Draw!')
+        print('Play again? y/n')
+        if 'y' in input().lower():
+            play(FEN)
+
+def get_colors():
+    print('White or Black? ')
+    playercolor = input().lower()
+
+    while not ('w' in playercolor or 'b' in playercolor):
+        print('White or Black? ')
+        playercolor = input().lower()
+
+    if 'w' in playercolor:
+        return ('White', 'Black')
+    elif 'b' in playercolor:
+        return ('Black', 'White')
+
+def engine_move(board, engine, probe):
+    """Let the engine pick a move and play it on the board, from the book or tables if it can. """
+    move = probe.choose(board.position) or engine.search(board.position, movetime=ENGINE_MOVETIME)
+    origin, to = move_from(move), move_to(move)
+
+    status = board.register_move((origin, to, move_promo(move)))
+    board.print_board(board.board)
+    print(f'Moved {board.board[to].name} to {board.reverse_pos(to)}')
+    return status
+
+def opposite_color(color):
+    return 'Black' if color.lower().startswith('w') else 'White'
+
+def parse_command(cmd, board):
+    commands = {
+        "HELP": 'helpstring',
+        "FEN": board.get_FEN(),
+        "STR": board.gamestring,
+        "PGN": board.get_PGN(),
+        #"SET": input('Enter FEN: ')  # along these lines
+        #"GET": board.all_moves_on_board,  # for testing
+    }
+
+    cmd = cmd.upper().strip()
+    print(commands.get(cmd, None))
+
+def prompt_FEN():
+    FEN = """rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"""
+
+    print('Begin from FEN? y/n')
+    if input().startswith('y'):
+        FEN = input('Enter FEN or type quit to use default: ').strip()
+        valid = validate_FEN(FEN)
+
+        while not valid == 'VALID':
+            print(valid)
+            FEN = input('Enter valid FEN or type n to use default: ')
+
+            if 'quit' in FEN:
+                FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+                break
+
+            valid = validate_FEN(FEN)
+
+    return FEN
+
+def validate_FEN(FEN):
+    # parsing already checks every field, so validating is just parsing and dropping the result
+    try:
+        parse_FEN(FEN)
+    except ValueError as e:
+        return str(e)
+
+    return 'VALID'
+
+
+if __name__ == '__main__':
+    # a GUI or match runner opens with uci, hand stdin over to the UCI loop and never draw the board
+    if 'uci' in sys.argv[1:]: uci.main()
+    else:
+        print('Type start to begin.', end='\n\n')
+
+        command = input().lower()
+        if command.strip() == 'uci': uci.main([command])
+        else:
+            while not 'start' in command:
+                if 'quit' in command: quit()
+                command = input().lower()
+            play(prompt_FEN())
+
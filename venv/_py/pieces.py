@@ -0,0 +1,215 @@
+# class Piece as parent classes for Pieces
+from position import KNIGHT_SQUARES, KING_SQUARES, RAY_SQUARES, PAWN_SQUARES
+from position import N, S, E, W, NE, NW, SE, SW, ROOK_DIRECTIONS, BISHOP_DIRECTIONS
+
+class Piece:
+    """Create a chess piece. Utilize the precomputed tables in position.py to check and perform legal moves.
+
+        # 8 [00] [01] [02] [03] [04] [05] [06] [07]
+        # 7 [08] [09] [10] [11] [12] [13] [14] [15]
+        # 6 [16] [17] [18] [19] [20] [21] [22] [23]
+        # 5 [24] [25] [26] [27] [28] [29] [30] [31]
+        # 4 [32] [33] [34] [35] [36] [37] [38] [39]
+        # 3 [40] [41] [42] [43] [44] [45] [46] [47]
+        # 2 [48] [49] [50] [51] [52] [53] [54] [55]
+        # 1 [56] [57] [58] [59] [60] [61] [62] [63]
+        #    a    b    c    d    e    f    g    h
+    """
+
+    def __init__(self, pos, color):
+        self.pos = pos
+        self.color = color[0].lower()  # 'black' and 'white' or 'b' and 'w' or such
+
+    def get_legal_moves(self, board):
+        """Return a list of all legal moves. """
+
+        return []
+
+    def move(self, board, newpos):
+        """Update piece position if requested move is within set of legal moves. """
+
+        legal_moves = self.get_legal_moves(board)
+
+        if newpos in legal_moves:
+            old = self.pos
+            self.pos = newpos
+            return (old, self.pos)
+
+        return None
+
+    @staticmethod
+    def legal_moves_helper(color, pos, direction, board):
+        """Walk a precomputed ray from pos until it hits a piece. """
+        legal_moves = []
+
+        # rays stop at the edge of the board by construction, so only blockers need checking
+        for n in RAY_SQUARES[direction][pos]:
+            if not isinstance(board[n], Piece):
+                legal_moves.append(n)
+                continue
+            elif board[n].color != color:
+                legal_moves.append(n)
+            break
+
+        return legal_moves
+
+
+class Pawn(Piece):
+    def __init__(self, pos, color, hasmoved=False, passant=None):
+        self.name = 'Pawn'
+        self.pos = pos
+        self.value = 1
+        self.passant = passant  # the en passant square, if this pawn can capture onto it
+
+        # used to prevent duplication of code later down the line. this is only necessary in pawns
+        # white pawns always decrease index - positive; black pawns increase - negative
+        if color.lower().startswith('w'):
+            self.tag = 'P'
+            self.forwardoffsets = (8, 16)  # first handles normal move, second handles first move double move
+            self.passantoffsets = (7, 9)  # first handles right diagonal, second handles left diagonal
+            self.hasmoved = True if self.pos not in range(48, 56) else False # any pawn not on home row must have moved
+        else:
+            self.tag = 'p'
+            self.forwardoffsets = (-8, -16)
+            self.passantoffsets = (-7, -9)
+            self.hasmoved = True if self.pos not in range(8, 16) else False
+
+        super().__init__(pos, color)
+
+    # pawns are tricky because their moves are unique depending on color so this method is very large
+    # to handle that
+    def get_legal_moves(self, board):
+        legal_moves = []
+
+        # handles positions of pawn in event of their respective moves
+        pos_doub = self.pos - self.forwardoffsets[1]
+        pos_norm = self.pos - self.forwardoffsets[0]
+
+        # normal move - promotion handled by board
+        if 0 <= pos_norm <= 63 and not isinstance(board[pos_norm], Piece):
+            legal_moves.append(pos_norm)
+
+            # first move double move - guaranteed will never hit edge of board so no need to check
+            if not self.hasmoved and not isinstance(board[pos_doub], Piece):
+                legal_moves.append(pos_doub)
+
+        # captures, and en passant onto the empty square behind an enemy pawn
+        for n in PAWN_SQUARES[self.tag == 'p'][self.pos]:
+            if isinstance(board[n], Piece):
+                if board[n].color != self.color:
+                    legal_moves.append(n)
+            elif n == self.passant:
+                behind = board[n + self.forwardoffsets[0]]
+                if isinstance(behind, Pawn) and behind.color != self.color:
+                    legal_moves.append(n)
+
+        return legal_moves
+
+class Knight(Piece):
+    def __init__(self, pos, color):
+        self.name = 'Knight'
+        self.value = 3
+        self.tag = 'N' if color.startswith('w') else 'n'
+
+        super().__init__(pos, color)
+
+    def get_legal_moves(self, board):
+        return self.legal_moves_helper(self.color, self.pos, board)
+
+    @staticmethod
+    def legal_moves_helper(color, pos, board):
+        # jumps are precomputed per square, so a jump across the "edge" of the board never shows up
+        return [n for n in KNIGHT_SQUARES[pos] if not isinstance(board[n], Piece) or board[n].color != color]
+
+class Bishop(Piece):
+    def __init__(self, pos, color):
+        self.name = 'Bishop'
+        self.value = 3
+        self.tag = 'B' if color.startswith('w') else 'b'
+
+        super().__init__(pos, color)
+
+    def get_legal_moves(self, board):
+        legal_moves = []
+
+        # upper right, bottom right, upper left, bottom left in that order
+        legal_moves.extend(self.legal_moves_helper(self.color, self.pos, NE, board))
+        legal_moves.extend(self.legal_moves_helper(self.color, self.pos, SE, board))
+        legal_moves.extend(self.legal_moves_helper(self.color, self.pos, NW, board))
+        legal_moves.extend(self.legal_moves_helper(self.color, self.pos, SW, board))
+
+        return legal_moves
+
+class Rook(Piece):
+    def __init__(self, pos, color):
+        self.name = 'Rook'
+        self.value = 5
+        self.tag = 'R' if color.startswith('w') else 'r'
+
+        super().__init__(pos, color)
+
+    def get_legal_moves(self, board):
+        legal_moves = []
+
+        # left, right, down, up in that order
+        legal_moves.extend(self.legal_moves_helper(self.color, self.pos, W, board))
+        legal_moves.extend(self.legal_moves_helper(self.color, self.pos, E, board))
+        legal_moves.extend(self.legal_moves_helper(self.color, self.pos, S, board))
+        legal_moves.extend(self.legal_moves_helper(self.color, self.pos, N, board))
+
+        return legal_moves
+
+class Queen(Piece):
+    def __init__(self, pos, color):
+        self.name = 'Queen'
+        self.value = 9
+        self.tag = 'Q' if color.startswith('w') else 'q'
+
+        super().__init__(pos, color)
+
+    def get_legal_moves(self, board):
+        legal_moves = []
+
+        # one shared ray walker now, so no more copying methods over from Bishop and Rook
+        for direction in BISHOP_DIRECTIONS + ROOK_DIRECTIONS:
+            legal_moves.extend(self.legal_moves_helper(self.color, self.pos, direction, board))
+
+        return legal_moves
+
+class King(Piece):
+    def __init__(self, pos, color):
+        self.name = 'King'
+        self.value = 0  # kings are never traded, so they count for nothing in material
+        self.tag = 'K' if color.startswith('w') else 'k'
+        self.castleking = False  # standard is default false
+        self.castlequeen = False  #
+
+        super().__init__(pos, color)
+
+    def update_castle_rights(self, rights):
+        """Update a King's castling rights using a rights string from a FEN. """
+        if rights == '-':
+            self.castleking = False
+            self.castlequeen = False
+        if self.tag in rights:
+            self.castleking = True
+        if chr(ord(self.tag) + 6) in rights:  # convert to q or Q
+            self.castlequeen = True
+
+    def get_legal_moves(self, board):
+        legal_moves = self.legal_moves_helper(self.color, self.pos, board)
+
+        # done this way for readability - can alternatively be done as any(filter(lambda)) for speed
+        if self.castleking and not any(isinstance(board[self.pos+n], Piece) for n in range(1,3)):
+            if isinstance(board[self.pos+3], Rook):
+                legal_moves.append(self.pos+2)
+        if self.castlequeen and not any(isinstance(board[self.pos-n], Piece) for n in range(1,4)):
+            if isinstance(board[self.pos-4], Rook):
+                legal_moves.append(self.pos-2)
+
+        return legal_moves
+
+    @staticmethod
+    def legal_moves_helper(color, pos, board):
+        # one square in every direction, precomputed like the Knight's jumps
+        return [n for n in KING_SQUARES[pos] if not isinstance(board[n], Piece) or board[n].color != color]
@@ -0,0 +1,539 @@
+# Position class as the compact backend behind Board: mailbox array, bitboards, attack tables
+from array import array
+from random import Random
+
+WHITE, BLACK = 0, 1
+EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(7)
+BLACKBIT = 8  # piece code is kind | BLACKBIT for black pieces, empty squares are 0
+
+PIECE_CODES = {
+    'P': PAWN, 'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING,
+    'p': PAWN | BLACKBIT, 'n': KNIGHT | BLACKBIT, 'b': BISHOP | BLACKBIT,
+    'r': ROOK | BLACKBIT, 'q': QUEEN | BLACKBIT, 'k': KING | BLACKBIT,
+}
+PIECE_TAGS = {code: tag for tag, code in PIECE_CODES.items()}
+PIECE_NAMES = ('', 'Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King')
+
+# castling rights as bits, in the same order a FEN lists them
+CASTLE_K, CASTLE_Q, CASTLE_k, CASTLE_q = 1, 2, 4, 8
+CASTLE_TAGS = ((CASTLE_K, 'K'), (CASTLE_Q, 'Q'), (CASTLE_k, 'k'), (CASTLE_q, 'q'))
+
+# directions as board offsets. positive ones walk towards h1, negative ones towards a8
+N, S, E, W = -8, 8, 1, -1
+NE, NW, SE, SW = -7, -9, 9, 7
+ROOK_DIRECTIONS = (N, S, E, W)
+BISHOP_DIRECTIONS = (NE, NW, SE, SW)
+STEPS = {N: (-1, 0), S: (1, 0), E: (0, 1), W: (0, -1), NE: (-1, 1), NW: (-1, -1), SE: (1, 1), SW: (1, -1)}
+
+FULL = (1 << 64) - 1
+FILE_A = sum(1 << (n * 8) for n in range(8))
+FILE_H = FILE_A << 7
+ROW_3 = 0xFF << 40  # rank 3, where white double moves pass through
+ROW_6 = 0xFF << 16  # rank 6, same for black
+
+
+def _walk(sq, step, limit=7):
+    """Return the squares reached by stepping from sq until the edge of the board. """
+    row, col = divmod(sq, 8)
+    squares = []
+    for n in range(limit):
+        row, col = row + step[0], col + step[1]
+        if not (0 <= row < 8 and 0 <= col < 8): break
+        squares.append(row * 8 + col)
+    return squares
+
+
+def _mask(squares):
+    """Return a bitboard with every square in squares set. """
+    mask = 0
+    for n in squares:
+        mask |= 1 << n
+    return mask
+
+
+# everything below is built once at import so move generation never has to worry about edge wrapping
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+KNIGHT_SQUARES = [[m for step in KNIGHT_JUMPS for m in _walk(n, step, 1)] for n in range(64)]
+KING_SQUARES = [[m for step in STEPS.values() for m in _walk(n, step, 1)] for n in range(64)]
+RAY_SQUARES = {d: [_walk(n, step) for n in range(64)] for d, step in STEPS.items()}
+# squares a pawn of either color attacks from a given square
+PAWN_SQUARES = (
+    [_walk(n, STEPS[NW], 1) + _walk(n, STEPS[NE], 1) for n in range(64)],
+    [_walk(n, STEPS[SW], 1) + _walk(n, STEPS[SE], 1) for n in range(64)],
+)
+
+KNIGHT_ATTACKS = [_mask(squares) for squares in KNIGHT_SQUARES]
+KING_ATTACKS = [_mask(squares) for squares in KING_SQUARES]
+RAYS = {d: [_mask(squares) for squares in rays] for d, rays in RAY_SQUARES.items()}
+PAWN_ATTACKS = tuple([_mask(squares) for squares in table] for table in PAWN_SQUARES)
+# the rays of each slider per square, for walking the mailbox
+BISHOP_RAYS = [[RAY_SQUARES[d][n] for d in BISHOP_DIRECTIONS if RAY_SQUARES[d][n]] for n in range(64)]
+ROOK_RAYS = [[RAY_SQUARES[d][n] for d in ROOK_DIRECTIONS if RAY_SQUARES[d][n]] for n in range(64)]
+# every square a slider on an empty board reaches, used to find possible pinners
+BISHOP_LINES = [RAYS[NE][n] | RAYS[NW][n] | RAYS[SE][n] | RAYS[SW][n] for n in range(64)]
+ROOK_LINES = [RAYS[N][n] | RAYS[S][n] | RAYS[E][n] | RAYS[W][n] for n in range(64)]
+# squares strictly between two squares on a shared line, 0 when they share none
+BETWEEN = [[0] * 64 for n in range(64)]
+for n in range(64):
+    for ray in RAY_SQUARES.values():
+        for m, sq in enumerate(ray[n]):
+            BETWEEN[n][sq] = _mask(ray[n][:m])
+
+# moving from or onto a square clears these castling rights
+CASTLE_MASKS = [0] * 64
+CASTLE_MASKS[63], CASTLE_MASKS[56], CASTLE_MASKS[60] = CASTLE_K, CASTLE_Q, CASTLE_K | CASTLE_Q
+CASTLE_MASKS[7], CASTLE_MASKS[0], CASTLE_MASKS[4] = CASTLE_k, CASTLE_q, CASTLE_k | CASTLE_q
+
+# zobrist keys, drawn from a fixed seed so hashes are stable between runs and processes
+_random = Random(0x5EED)
+ZOBRIST_PIECES = [[_random.getrandbits(64) if code in PIECE_TAGS else 0 for n in range(64)] for code in range(15)]
+ZOBRIST_EP = [_random.getrandbits(64) for n in range(8)]  # per file
+ZOBRIST_SIDE = _random.getrandbits(64)  # xored in when black is to move
+_rights = [_random.getrandbits(64) for n in range(4)]
+ZOBRIST_CASTLE = [0] * 16  # per castling rights value, every right already xored together
+for n in range(16):
+    for m in range(4):
+        if n & (1 << m): ZOBRIST_CASTLE[n] ^= _rights[m]
+
+
+def lsb(mask):
+    """Return the index of the lowest set bit. """
+    return (mask & -mask).bit_length() - 1
+
+
+def squares_of(mask):
+    """Return the index of every set bit, lowest first. """
+    squares = []
+    while mask:
+        low = mask & -mask
+        squares.append(low.bit_length() - 1)
+        mask ^= low
+    return squares
+
+
+def rook_attacks(sq, occ):
+    """Return every square a rook on sq attacks through the given occupancy. """
+    # positive directions are blocked first by their lowest bit, negative ones by their highest
+    attacks = 0
+    ray = RAYS[S][sq]
+    if ray & occ: ray ^= RAYS[S][lsb(ray & occ)]
+    attacks |= ray
+    ray = RAYS[E][sq]
+    if ray & occ: ray ^= RAYS[E][lsb(ray & occ)]
+    attacks |= ray
+    ray = RAYS[N][sq]
+    if ray & occ: ray ^= RAYS[N][(ray & occ).bit_length() - 1]
+    attacks |= ray
+    ray = RAYS[W][sq]
+    if ray & occ: ray ^= RAYS[W][(ray & occ).bit_length() - 1]
+    return attacks | ray
+
+
+def bishop_attacks(sq, occ):
+    """Return every square a bishop on sq attacks through the given occupancy. """
+    attacks = 0
+    ray = RAYS[SE][sq]
+    if ray & occ: ray ^= RAYS[SE][lsb(ray & occ)]
+    attacks |= ray
+    ray = RAYS[SW][sq]
+    if ray & occ: ray ^= RAYS[SW][lsb(ray & occ)]
+    attacks |= ray
+    ray = RAYS[NE][sq]
+    if ray & occ: ray ^= RAYS[NE][(ray & occ).bit_length() - 1]
+    attacks |= ray
+    ray = RAYS[NW][sq]
+    if ray & occ: ray ^= RAYS[NW][(ray & occ).bit_length() - 1]
+    return attacks | ray
+
+
+SQUARE_NAMES = [f'{chr(97 + n % 8)}{8 - n // 8}' for n in range(64)]
+
+
+# moves are packed into 16 bits: origin in bits 0-5, target in 6-11, promotion kind in 12-14
+def encode_move(origin, to, promo=0):
+    return origin | (to << 6) | (promo << 12)
+
+def move_from(move):
+    return move & 63
+
+def move_to(move):
+    return (move >> 6) & 63
+
+def move_promo(move):
+    return move >> 12
+
+def move_name(move):
+    """Return a move in long algebraic notation, like e2e4 or e7e8q. """
+    promo = PIECE_TAGS[(move >> 12) | BLACKBIT] if move >> 12 else ''
+    return SQUARE_NAMES[move & 63] + SQUARE_NAMES[(move >> 6) & 63] + promo
+
+
+class Position:
+    """Hold a chess position as a mailbox array and per-piece bitboards.
+
+        Squares use the same indexing as Board, 0 is a8 and 63 is h1, and bit n
+        of every bitboard is square n.
+    """
+
+    def __init__(self):
+        self.squares = array('b', bytes(64))  # piece code per square, 0 when empty
+        self.bb = [0] * 15  # bitboard per piece code
+        self.occ = [0, 0]  # bitboard per color
+
+        self.tomove = WHITE
+        self.castle = 0
+        self.ep = -1  # en passant target square
+        self.halfmoves = 0
+        self.fullmoves = 1
+
+        self.key = 0  # zobrist hash, kept up to date by make_move and unmake_move
+        self.history = []  # undo stack of (move, captured, castle, ep, halfmoves, key)
+
+    def clear(self):
+        """Remove every piece and reset the game state. """
+        self.__init__()
+
+    def copy(self):
+        """Return an independent copy of the position, undo stack included. """
+        other = Position.__new__(Position)
+        other.squares = array('b', self.squares)
+        other.bb = self.bb[:]
+        other.occ = self.occ[:]
+        other.tomove, other.castle, other.ep = self.tomove, self.castle, self.ep
+        other.halfmoves, other.fullmoves = self.halfmoves, self.fullmoves
+        other.key = self.key
+        other.history = self.history[:]
+        return other
+
+    def put(self, sq, code):
+        """Place the piece with the given code on an empty square. """
+        bit = 1 << sq
+        self.squares[sq] = code
+        self.bb[code] |= bit
+        self.occ[code >> 3] |= bit
+
+    def remove(self, sq):
+        """Take the piece off a square and return its code. """
+        code = self.squares[sq]
+        bit = 1 << sq
+        self.squares[sq] = 0
+        self.bb[code] ^= bit
+        self.occ[code >> 3] ^= bit
+        return code
+
+    def compute_key(self):
+        """Return the zobrist hash of the position, computed from scratch. """
+        key = ZOBRIST_CASTLE[self.castle]
+        for n in range(64):
+            if self.squares[n]: key ^= ZOBRIST_PIECES[self.squares[n]][n]
+        if self.ep >= 0: key ^= ZOBRIST_EP[self.ep & 7]
+        if self.tomove == BLACK: key ^= ZOBRIST_SIDE
+        return key
+
+    def make_move(self, move):
+        """Play an encoded move, pushing what is needed to take it back onto the undo stack. """
+        frm, to, promo = move & 63, (move >> 6) & 63, move >> 12
+        squares = self.squares
+        us = self.tomove
+        code = squares[frm]
+        captured = squares[to]
+        ep = self.ep
+        key = self.key
+        self.history.append((move, captured, self.castle, ep, self.halfmoves, key))
+
+        if ep >= 0:
+            key ^= ZOBRIST_EP[ep & 7]
+            self.ep = -1
+        if captured:
+            self.remove(to)
+            key ^= ZOBRIST_PIECES[captured][to]
+        self.remove(frm)
+        key ^= ZOBRIST_PIECES[code][frm]
+        self.halfmoves = 0 if captured else self.halfmoves + 1
+
+        kind = code & 7
+        if kind == PAWN:
+            self.halfmoves = 0
+            if promo:
+                code = promo | (us << 3)
+            elif to == ep:
+                # the captured pawn sits one row back from the target square
+                behind = to + (8 if us == WHITE else -8)
+                key ^= ZOBRIST_PIECES[self.remove(behind)][behind]
+            elif abs(to - frm) == 16:
+                # only record en passant when an enemy pawn can actually take it, so hashes match
+                target = (frm + to) >> 1
+                if PAWN_ATTACKS[us][target] & self.bb[PAWN | ((us ^ 1) << 3)]:
+                    self.ep = target
+                    key ^= ZOBRIST_EP[target & 7]
+        elif kind == KING and abs(to - frm) == 2:
+            # kingside else queenside
+            rook_at, rook_to = (to + 1, to - 1) if to > frm else (to - 2, to + 1)
+            rook = self.remove(rook_at)
+            self.put(rook_to, rook)
+            key ^= ZOBRIST_PIECES[rook][rook_at] ^ ZOBRIST_PIECES[rook][rook_to]
+
+        self.put(to, code)
+        key ^= ZOBRIST_PIECES[code][to]
+
+        castle = self.castle & ~(CASTLE_MASKS[frm] | CASTLE_MASKS[to])
+        if castle != self.castle:
+            key ^= ZOBRIST_CASTLE[self.castle] ^ ZOBRIST_CASTLE[castle]
+            self.castle = castle
+
+        if us == BLACK: self.fullmoves += 1
+        self.tomove = us ^ 1
+        self.key = key ^ ZOBRIST_SIDE
+
+    def unmake_move(self):
+        """Take back the last move played with make_move. """
+        move, captured, self.castle, self.ep, self.halfmoves, self.key = self.history.pop()
+        frm, to, promo = move & 63, (move >> 6) & 63, move >> 12
+        self.tomove ^= 1
+        us = self.tomove
+        if us == BLACK: self.fullmoves -= 1
+
+        code = self.remove(to)
+        if promo: code = PAWN | (us << 3)
+        self.put(frm, code)
+        if captured: self.put(to, captured)
+
+        kind = code & 7
+        if kind == PAWN and to == self.ep:
+            self.put(to + (8 if us == WHITE else -8), PAWN | ((us ^ 1) << 3))
+        elif kind == KING and abs(to - frm) == 2:
+            rook_at, rook_to = (to + 1, to - 1) if to > frm else (to - 2, to + 1)
+            self.put(rook_at, self.remove(rook_to))
+
+    def is_repetition(self):
+        """Return True if the position has already occurred since the last capture or pawn move. """
+        history = self.history
+        key = self.key
+        # only the same side to move can repeat, so step back two plies at a time
+        for n in range(2, min(self.halfmoves, len(history)) + 1, 2):
+            if history[-n][5] == key: return True
+        return False
+
+    def king_square(self, color):
+        """Return the square of the given color's king, or -1 if there is none. """
+        return lsb(self.bb[KING | (color << 3)])
+
+    def attackers_to(self, sq, color, occ=None):
+        """Return a bitboard of every piece of the given color that attacks sq. """
+        if occ is None: occ = self.occ[0] | self.occ[1]
+        bb = self.bb
+        colorbit = color << 3
+        queens = bb[QUEEN | colorbit]
+
+        # a pawn of color attacks sq exactly when a pawn of the other color on sq would attack it back
+        return (PAWN_ATTACKS[color ^ 1][sq] & bb[PAWN | colorbit]) \
+            | (KNIGHT_ATTACKS[sq] & bb[KNIGHT | colorbit]) \
+            | (KING_ATTACKS[sq] & bb[KING | colorbit]) \
+            | (rook_attacks(sq, occ) & (bb[ROOK | colorbit] | queens)) \
+            | (bishop_attacks(sq, occ) & (bb[BISHOP | colorbit] | queens))
+
+    def attack_map(self, color, occ=None):
+        """Return a bitboard of every square the given color attacks. """
+        if occ is None: occ = self.occ[0] | self.occ[1]
+        bb = self.bb
+        colorbit = color << 3
+
+        pawns = bb[PAWN | colorbit]
+        if color == WHITE:
+            attacks = ((pawns & ~FILE_A) >> 9) | ((pawns & ~FILE_H) >> 7)
+        else:
+            attacks = (((pawns & ~FILE_A) << 7) | ((pawns & ~FILE_H) << 9)) & FULL
+
+        for sq in squares_of(bb[KNIGHT | colorbit]):
+            attacks |= KNIGHT_ATTACKS[sq]
+        queens = bb[QUEEN | colorbit]
+        for sq in squares_of(bb[BISHOP | colorbit] | queens):
+            attacks |= bishop_attacks(sq, occ)
+        for sq in squares_of(bb[ROOK | colorbit] | queens):
+            attacks |= rook_attacks(sq, occ)
+        king = bb[KING | colorbit]
+        if king: attacks |= KING_ATTACKS[lsb(king)]
+        return attacks
+
+    def pins(self, color):
+        """Return a dict of the given color's pinned pieces, mapping each square to the squares it may still move to. """
+        king = self.king_square(color)
+        if king < 0: return {}
+        bb = self.bb
+        own = self.occ[color]
+        occ = own | self.occ[color ^ 1]
+        colorbit = (color ^ 1) << 3
+        queens = bb[QUEEN | colorbit]
+
+        # an enemy slider pins a piece when that piece is the only one between it and the king
+        pins = {}
+        snipers = (BISHOP_LINES[king] & (bb[BISHOP | colorbit] | queens)) \
+            | (ROOK_LINES[king] & (bb[ROOK | colorbit] | queens))
+        for sq in squares_of(snipers):
+            between = BETWEEN[king][sq]
+            blockers = between & occ
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pins[lsb(blockers)] = between | (1 << sq)
+        return pins
+
+    def is_attacked(self, sq, color):
+        """Return True if any piece of the given color attacks sq. """
+        return bool(self.attackers_to(sq, color))
+
+    def in_check(self, color=None):
+        """Return True if the given color's king, by default the side to move's, is attacked. """
+        if color is None: color = self.tomove
+        king = self.king_square(color)
+        return king >= 0 and self.is_attacked(king, color ^ 1)
+
+    def pseudo_moves(self, color=None):
+        """Return every pseudo-legal move for a color, by default the side to move. """
+        # walking precomputed square lists over the mailbox beats scanning bitboards bit by bit in python,
+        # so bitboards are kept for attack queries and piece lookup only
+        us = self.tomove if color is None else color
+        bb = self.bb
+        squares = self.squares
+        colorbit = us << 3
+        moves = []
+        append = moves.append
+
+        for frm in squares_of(bb[KNIGHT | colorbit]):
+            for to in KNIGHT_SQUARES[frm]:
+                code = squares[to]
+                if not code or code >> 3 != us: append(frm | (to << 6))
+
+        queens = bb[QUEEN | colorbit]
+        for rays, pieces in ((BISHOP_RAYS, bb[BISHOP | colorbit] | queens), (ROOK_RAYS, bb[ROOK | colorbit] | queens)):
+            for frm in squares_of(pieces):
+                for ray in rays[frm]:
+                    for to in ray:
+                        code = squares[to]
+                        if not code:
+                            append(frm | (to << 6))
+                            continue
+                        if code >> 3 != us: append(frm | (to << 6))
+                        break
+
+        king = self.king_square(us)
+        if king >= 0:
+            for to in KING_SQUARES[king]:
+                code = squares[to]
+                if not code or code >> 3 != us: append(king | (to << 6))
+            if self.castle: self._castle_moves(us, self.occ[0] | self.occ[1], moves)
+
+        self._pawn_moves(us, self.occ[us ^ 1], self.occ[0] | self.occ[1], moves)
+        return moves
+
+    def _pawn_moves(self, us, enemy, occ, moves):
+        """Add pawn pushes, captures and promotions to moves, setwise. """
+        pawns = self.bb[PAWN | (us << 3)]
+        if not pawns: return
+        empty = ~occ & FULL
+        if us == self.tomove and self.ep >= 0: enemy |= 1 << self.ep
+
+        # white moves towards index 0 so its pawns shift right, black pawns shift left
+        if us == WHITE:
+            single = (pawns >> 8) & empty
+            double = ((single & ROW_3) >> 8) & empty
+            left = ((pawns & ~FILE_A) >> 9) & enemy
+            right = ((pawns & ~FILE_H) >> 7) & enemy
+            forward, promorow = -8, 0
+        else:
+            single = (pawns << 8) & empty
+            double = ((single & ROW_6) << 8) & empty
+            left = ((pawns & ~FILE_A) << 7) & enemy
+            right = ((pawns & ~FILE_H) << 9) & enemy
+            forward, promorow = 8, 7
+
+        for targets, offset in ((single, forward), (double, 2 * forward),
+                                (left, forward - 1), (right, forward + 1)):
+            for to in squares_of(targets):
+                frm = to - offset
+                if to >> 3 == promorow:
+                    for promo in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        moves.append(frm | (to << 6) | (promo << 12))
+                else:
+                    moves.append(frm | (to << 6))
+
+    def _castle_moves(self, us, occ, moves):
+        """Add castling moves to moves. The king may not castle out of, through or into check. """
+        them = us ^ 1
+        rookcode = ROOK | (us << 3)
+        if us == WHITE:
+            king, kingside, queenside = 60, CASTLE_K, CASTLE_Q
+        else:
+            king, kingside, queenside = 4, CASTLE_k, CASTLE_q
+        if self.squares[king] != KING | (us << 3) or self.is_attacked(king, them): return
+
+        if self.castle & kingside and not occ & (3 << (king + 1)) and self.squares[king + 3] == rookcode:
+            if not self.is_attacked(king + 1, them) and not self.is_attacked(king + 2, them):
+                moves.append(king | ((king + 2) << 6))
+        if self.castle & queenside and not occ & (7 << (king - 3)) and self.squares[king - 4] == rookcode:
+            if not self.is_attacked(king - 1, them) and not self.is_attacked(king - 2, them):
+                moves.append(king | ((king - 2) << 6))
+
+    def legal_moves(self):
+        """Return every legal move for the side to move. """
+        return list(self.iter_legal_moves())
+
+    def has_legal_move(self):
+        """Return True if the side to move has any legal move, stopping at the first one found. """
+        return next(self.iter_legal_moves(), None) is not None
+
+    def iter_legal_moves(self):
+        """Yield the legal moves for the side to move.
+
+            Legality comes from masks built once per position: the squares the enemy
+            attacks with our king lifted off the board, the squares that resolve a check,
+            and the line each pinned piece is tied to. No move is played out except for
+            en passant, which can uncover a check along the row of both pawns.
+        """
+        us = self.tomove
+        them = us ^ 1
+        king = self.king_square(us)
+        if king < 0:
+            yield from self.pseudo_moves()
+            return
+
+        occ = self.occ[0] | self.occ[1]
+        danger = self.attack_map(them, occ ^ (1 << king))
+        checkers = self.attackers_to(king, them, occ)
+        if not checkers:
+            checkmask = FULL
+        elif checkers & (checkers - 1):
+            checkmask = 0  # double check, only the king may move
+        else:
+            checkmask = checkers | BETWEEN[king][lsb(checkers)]
+        pins = self.pins(us)
+        ep = self.ep
+        squares = self.squares
+
+        for move in self.pseudo_moves():
+            frm, to = move & 63, (move >> 6) & 63
+            if frm == king:
+                if not danger >> to & 1: yield move
+            elif to == ep and squares[frm] & 7 == PAWN:
+                # undo before yielding, a caller that stops early would otherwise leave the capture played
+                self.make_move(move)
+                legal = not self.in_check(us)
+                self.unmake_move()
+                if legal: yield move
+            elif checkmask >> to & 1 and (frm not in pins or pins[frm] >> to & 1):
+                yield move
+
+    def status(self):
+        """Return "CHECKMATE", "STALEMATE", "FIFTY" or "CONTINUE" for the side to move. """
+        if not self.has_legal_move():
+            return "CHECKMATE" if self.in_check() else "STALEMATE"
+        if self.halfmoves >= 100: return "FIFTY"  # halfmoves count plies, so this is fifty full moves
+        return "CONTINUE"
+
+    def moves_from(self, sq):
+        """Return the target squares of every legal move of the piece on sq. """
+        code = self.squares[sq]
+        if not code or code >> 3 != self.tomove: return []
+        targets = []
+        for move in self.iter_legal_moves():
+            if move & 63 == sq and move_to(move) not in targets:
+                targets.append(move_to(move))
+        return targets
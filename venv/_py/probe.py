@@ -0,0 +1,349 @@
+# Probe layer in front of the search: a memory-mapped opening book and retrograde endgame tables
+import argparse
+import mmap
+import os
+import struct
+import sys
+from bisect import bisect_left
+from random import Random
+
+from polyglot import polyglot_key
+from position import *
+from record import MAGIC, GameReader, import_pgn
+from search import MATE
+
+DEFAULT_BOOK = 'book.bin'
+DEFAULT_TABLES = 'tables'
+
+# a book is a flat run of entries sorted by Polyglot key in the Polyglot layout, so Polyglot .bin books work as is
+BOOK_ENTRY = struct.Struct('>QHHI')  # position key, move, weight, learn
+BOOK_PLIES = 20  # how deep into every game build_book looks
+PROMOTION_KINDS = (0, KNIGHT, BISHOP, ROOK, QUEEN)  # Polyglot promotion field to piece kind
+# Polyglot writes castling as the king taking its own rook
+BOOK_CASTLES = {(60, 63): 62, (60, 56): 58, (4, 7): 6, (4, 0): 2}
+
+# a table holds every placement of the strong king, the strong piece and the lone king, as if the strong
+# side were white. each byte is 0 for a draw or an impossible position, otherwise plies to mate plus one
+TABLES = {'KQK': QUEEN, 'KRK': ROOK, 'KPK': PAWN}
+TABLE_SIZE = 64 * 64 * 64
+TABLE_NAMES = {kind: name for name, kind in TABLES.items()}
+
+
+def book_move(position, entry):
+    """Turn a Polyglot move from a book entry into a move in this position. """
+    to, origin = (entry & 63) ^ 56, ((entry >> 6) & 63) ^ 56  # Polyglot counts rows from the first rank
+    if position.squares[origin] & 7 == KING: to = BOOK_CASTLES.get((origin, to), to)
+    return encode_move(origin, to, PROMOTION_KINDS[(entry >> 12) & 7])
+
+
+def polyglot_move(position, move):
+    """Turn a move in this position into a Polyglot move. """
+    origin, to = move & 63, move_to(move)
+    if position.squares[origin] & 7 == KING and abs(to - origin) == 2:
+        to = origin + 3 if to > origin else origin - 4
+    return (to ^ 56) | ((origin ^ 56) << 6) | (PROMOTION_KINDS.index(move_promo(move)) << 12)
+
+
+class OpeningBook:
+    """Look up book moves by binary search over a memory-mapped book file.
+
+        Nothing is read until the first lookup, and a lookup only touches the entries it
+        bisects through. A missing or empty file is a book with no moves.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.map = None
+        self.size = None  # entries in the book, None until it is opened
+
+    def open(self):
+        self.size = 0
+        if not os.path.exists(self.path): return
+        self.file = open(self.path, 'rb')
+        if self.file.seek(0, 2):
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.size = len(self.map) // BOOK_ENTRY.size
+
+    def key_at(self, n):
+        return BOOK_ENTRY.unpack_from(self.map, n * BOOK_ENTRY.size)[0]
+
+    def entries(self, key):
+        """Return the (Polyglot move, weight) pairs stored for a key. """
+        if self.size is None: self.open()
+        n = bisect_left(range(self.size), key, key=self.key_at)
+        entries = []
+        while n < self.size:
+            entry_key, move, weight, learn = BOOK_ENTRY.unpack_from(self.map, n * BOOK_ENTRY.size)
+            if entry_key != key: break
+            entries.append((move, weight))
+            n += 1
+        return entries
+
+    def moves(self, position):
+        """Return the (move, weight) pairs the book has for a position, legal moves only. """
+        entries = self.entries(polyglot_key(position))
+        if not entries: return []
+        # a key collision can bring up moves from some other position, so they are checked
+        legal = position.legal_moves()
+        moves = [(book_move(position, entry), weight) for entry, weight in entries]
+        return [(move, weight) for move, weight in moves if move in legal and weight]
+
+    def close(self):
+        if self.map: self.map.close()
+        if self.file: self.file.close()
+        self.file = self.map = self.size = None
+
+
+def build_book(sources, path, plies=BOOK_PLIES):
+    """Write a book from PGN or game files and return how many entries it has.
+
+        A move is weighted 2 for every game its side won, 1 for every draw or unfinished game
+        and 0 for a loss, so moves that only ever lost are left out.
+    """
+    weights = {}
+    for source in sources:
+        with open(source, 'rb') as f: binary = f.read(len(MAGIC)) == MAGIC
+        if binary:
+            with GameReader(source) as reader: games = list(reader)
+        else:
+            with open(source) as f: games = list(import_pgn(f))
+
+        for game in games:
+            position = None
+            for n, (position, move) in enumerate(zip(game.replay(), game.moves)):
+                if n >= plies: break
+                won = game.result == ('1-0', '0-1')[position.tomove]
+                lost = game.result == ('0-1', '1-0')[position.tomove]
+                entry = (polyglot_key(position), polyglot_move(position, move))
+                weights[entry] = weights.get(entry, 0) + (2 if won else 0 if lost else 1)
+
+    entries = sorted(((key, move, weight) for (key, move), weight in weights.items() if weight),
+                     key=lambda entry: (entry[0], -entry[2]))
+    # weights only have 16 bits, so a big enough corpus has them all scaled down
+    scale = max([entry[2] for entry in entries], default=0) / 0xFFFF
+    with open(path, 'wb') as f:
+        for key, move, weight in entries:
+            if scale > 1: weight = max(1, int(weight / scale))
+            f.write(BOOK_ENTRY.pack(key, move, weight, 0))
+    return len(entries)
+
+
+def piece_attacks(kind, sq, occ):
+    """Return the squares a white piece of the given kind attacks from sq. """
+    if kind == QUEEN: return rook_attacks(sq, occ) | bishop_attacks(sq, occ)
+    if kind == ROOK: return rook_attacks(sq, occ)
+    return PAWN_ATTACKS[WHITE][sq]
+
+
+def generate_table(kind, promotions=None):
+    """Work out a table by retrograde analysis and return it as (strong side to move, weak side to move).
+
+        Starts from every mate and steps back one ply at a time: a strong side position wins
+        as soon as one move reaches a lost position, a weak side position loses once every
+        king move has been shown to reach a won one. promotions maps QUEEN and ROOK to their
+        finished tables, which a pawn table needs to know what promoting wins.
+    """
+    strong = bytearray(TABLE_SIZE)
+    weak = bytearray(TABLE_SIZE)
+    counts = bytearray(TABLE_SIZE)  # weak king moves not yet known to lose
+    pieces = range(8, 56) if kind == PAWN else range(64)  # pawns never stand on the first or last rank
+
+    # squares the strong side covers with the weak king lifted off the board, per king and piece square
+    attacks = [0] * 4096
+    frontier = []  # weak side to move positions lost in the current number of plies
+    for wk in range(64):
+        for x in pieces:
+            if x == wk: continue
+            attacked = attacks[wk << 6 | x] = KING_ATTACKS[wk] | piece_attacks(kind, x, 1 << wk)
+            for bk in range(64):
+                if bk == wk or bk == x or KING_ATTACKS[wk] >> bk & 1: continue
+                index = wk << 12 | x << 6 | bk
+                moves = KING_ATTACKS[bk] & ~attacked
+                counts[index] = moves.bit_count()
+                if not moves and attacked >> bk & 1:
+                    weak[index] = 1
+                    frontier.append(index)
+
+    # wins by promoting go in by how long the promoted piece takes to mate
+    pending = {}
+    if kind == PAWN:
+        for wk in range(64):
+            for x in range(8, 16):
+                to = x - 8
+                if wk in (x, to): continue
+                for bk in range(64):
+                    if bk in (wk, x, to) or KING_ATTACKS[wk] >> bk & 1 or attacks[wk << 6 | x] >> bk & 1: continue
+                    value = min((promotions[promo][1][wk << 12 | to << 6 | bk] or 255) for promo in (QUEEN, ROOK))
+                    if value < 255: pending.setdefault(value + 1, []).append(wk << 12 | x << 6 | bk)
+
+    value = 2
+    while frontier or pending:
+        # strong side to move: one move into a lost position is enough
+        found = pending.pop(value, [])
+        for index in frontier:
+            wk, x, bk = index >> 12, index >> 6 & 63, index & 63
+            occ = 1 << wk | 1 << x | 1 << bk
+            for f in squares_of(KING_ATTACKS[wk] & ~occ):
+                found.append(f << 12 | x << 6 | bk)
+            if kind == PAWN:
+                if not occ >> (x + 8) & 1 and x + 8 < 56:
+                    found.append(wk << 12 | (x + 8) << 6 | bk)
+                    if 32 <= x < 40 and not occ >> (x + 16) & 1: found.append(wk << 12 | (x + 16) << 6 | bk)
+            else:
+                for f in squares_of(piece_attacks(kind, x, occ) & ~occ):
+                    found.append(wk << 12 | f << 6 | bk)
+
+        won = []
+        for index in found:
+            if strong[index]: continue
+            wk, x, bk = index >> 12, index >> 6 & 63, index & 63
+            # the lone king can't be next to the other king or already in check with the strong side to move
+            if KING_ATTACKS[wk] >> bk & 1 or attacks[wk << 6 | x] >> bk & 1: continue
+            strong[index] = value
+            won.append(index)
+
+        # weak side to move: lost once its last king move is into a won position
+        frontier = []
+        for index in won:
+            wk, x, bk = index >> 12, index >> 6 & 63, index & 63
+            for f in squares_of(KING_ATTACKS[bk] & ~(KING_ATTACKS[wk] | 1 << wk | 1 << x)):
+                parent = wk << 12 | x << 6 | f
+                counts[parent] -= 1
+                if not counts[parent]:
+                    weak[parent] = value + 1
+                    frontier.append(parent)
+        value += 2
+
+    return strong, weak
+
+
+def generate_tables(directory=DEFAULT_TABLES):
+    """Generate every table into a directory, queen and rook first since the pawn table needs them. """
+    os.makedirs(directory, exist_ok=True)
+    finished = {}
+    for name, kind in TABLES.items():
+        finished[kind] = generate_table(kind, finished)
+        with open(os.path.join(directory, f'{name}.bin'), 'wb') as f:
+            f.write(finished[kind][0])
+            f.write(finished[kind][1])
+
+
+class Probe:
+    """Answer positions from the opening book or the endgame tables, before any search.
+
+        The book and each table are only opened the first time a position needs them. Missing
+        files are simply never hit. Hits and misses are counted for both.
+    """
+
+    def __init__(self, book=DEFAULT_BOOK, tables=DEFAULT_TABLES, seed=None):
+        self.book = OpeningBook(book) if book else None
+        self.directory = tables
+        self.tables = {}  # material name to a memory map of its table, or None if there is no file
+        self.random = Random(seed)
+        self.book_hits = 0
+        self.book_misses = 0
+        self.table_hits = 0
+        self.table_misses = 0
+
+    def table(self, name):
+        """Return the memory map of a table, opening it the first time. """
+        if name not in self.tables:
+            self.tables[name] = None
+            path = os.path.join(self.directory or '', f'{name}.bin')
+            if self.directory and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    self.tables[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.tables[name]
+
+    def table_score(self, position):
+        """Return the exact score of a position for the side to move, or None if the tables don't cover it.
+
+            Scores are mate scores like the search's, or 0 for a draw.
+        """
+        everything = position.occ[WHITE] | position.occ[BLACK]
+        if everything.bit_count() > 3 or position.castle: return None
+        # FENs without exactly one king a side parse fine, but no table covers them
+        if position.bb[KING].bit_count() != 1 or position.bb[KING | BLACKBIT].bit_count() != 1: return None
+        if everything.bit_count() == 2: return 0
+
+        sq = lsb(everything & ~(position.bb[KING] | position.bb[KING | BLACKBIT]))
+        code = position.squares[sq]
+        if code & 7 in (KNIGHT, BISHOP): return 0  # a lone minor piece can't mate
+        if code & 7 == PAWN and not 8 <= sq < 56: return None  # nor does one on the first or last rank
+        table = self.table(TABLE_NAMES[code & 7])
+        if table is None: return None
+
+        # tables are from white's side, so a black strong side is looked up on the flipped board
+        strong = code >> 3
+        flip = 56 if strong == BLACK else 0
+        wk = lsb(position.bb[KING | strong << 3]) ^ flip
+        bk = lsb(position.bb[KING | (strong ^ 1) << 3]) ^ flip
+        index = wk << 12 | (sq ^ flip) << 6 | bk
+        to_move_is_strong = position.tomove == strong
+        value = table[index if to_move_is_strong else TABLE_SIZE + index]
+        if not value: return 0
+        return MATE - (value - 1) if to_move_is_strong else -(MATE - (value - 1))
+
+    def table_move(self, position):
+        """Return the move the tables rate best, or 0 if they don't cover the position. """
+        if self.table_score(position) is None: return 0
+        best, best_score = 0, None
+        for move in position.legal_moves():
+            position.make_move(move)
+            score = self.table_score(position)
+            position.unmake_move()
+            if score is None: return 0
+            if best_score is None or -score > best_score: best, best_score = move, -score
+        return best
+
+    def book_move(self, position):
+        """Return a book move picked at random by weight, or 0 if the book has none. """
+        moves = self.book.moves(position) if self.book else []
+        if not moves: return 0
+        return self.random.choices([move for move, weight in moves], [weight for move, weight in moves])[0]
+
+    def choose(self, position):
+        """Return a move for the position straight from the tables or the book, or 0 if the search is needed. """
+        if (position.occ[WHITE] | position.occ[BLACK]).bit_count() <= 3:
+            move = self.table_move(position)
+            if move: self.table_hits += 1
+            else: self.table_misses += 1
+            return move
+
+        if self.book is None: return 0
+        move = self.book_move(position)
+        if move: self.book_hits += 1
+        else: self.book_misses += 1
+        return move
+
+    def close(self):
+        if self.book: self.book.close()
+        for table in self.tables.values():
+            if table: table.close()
+        self.tables = {}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build the opening book and endgame tables the engine probes.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    book = commands.add_parser('book', help='build an opening book from PGN or game files')
+    book.add_argument('files', nargs='+', help='PGN or game files to read')
+    book.add_argument('--output', default=DEFAULT_BOOK, help=f'book file to write (default {DEFAULT_BOOK})')
+    book.add_argument('--plies', type=int, default=BOOK_PLIES,
+                      help=f'plies of every game to take (default {BOOK_PLIES})')
+    tables = commands.add_parser('tables', help='generate the KQK, KRK and KPK endgame tables')
+    tables.add_argument('directory', nargs='?', default=DEFAULT_TABLES,
+                        help=f'directory to write them to (default {DEFAULT_TABLES})')
+    args = parser.parse_args(argv)
+
+    if args.command == 'book':
+        print(f'{build_book(args.files, args.output, args.plies)} entries written to {args.output}')
+    else:
+        generate_tables(args.directory)
+        print(f'{", ".join(TABLES)} written to {args.directory}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,361 @@
+# Game records: compact binary game files, a memory-mapped reader, PGN/SAN and a position index
+import mmap
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from fen import parse_FEN
+from position import *
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+RESULTS = ('*', '1-0', '0-1', '1/2-1/2')
+
+# a game file is the file header followed by games back to back. every game is its header, the start
+# FEN if it isn't the standard one, then its moves as little-endian 16-bit encoded moves
+MAGIC = b'SLCG'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sH')  # magic, version
+GAME_HEADER = struct.Struct('<HBH')  # move count, index into RESULTS, start FEN length (0 for the standard start)
+
+# an index file is a flat run of entries sorted by key, 16 bytes each, big-endian like a Polyglot book
+INDEX_ENTRY = struct.Struct('>QQ')  # position key, game offset
+
+
+class Game:
+    """Hold one recorded game: its start FEN, its encoded moves and its result. """
+
+    def __init__(self, FEN=None, moves=None, result='*', offset=None):
+        self.FEN = FEN or START_FEN
+        self.moves = array('H', moves or [])
+        self.result = result
+        self.offset = offset  # where the game starts in its file, if it came from one
+        self.tags = {}  # PGN tags, only kept in memory
+
+    def replay(self):
+        """Yield the position before the first move and after every move, on one Position that changes as it goes. """
+        position = parse_FEN(self.FEN)
+        yield position
+        for move in self.moves:
+            position.make_move(move)
+            yield position
+
+    def keys(self):
+        """Return the zobrist key of every position reached in the game, in order. """
+        return [position.key for position in self.replay()]
+
+
+class GameWriter:
+    """Append games to a game file.
+
+        A game can be written whole with write_game, or built up move by move with begin,
+        append and finish, which is how Board.register_move records the game being played.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0: self.file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self.FEN = None
+        self.moves = array('H')
+
+    def write_game(self, FEN, moves, result='*'):
+        """Write a whole game and return its offset in the file. """
+        FEN = '' if not FEN or FEN == START_FEN else FEN
+        moves = array('H', moves)
+        if moves.itemsize != 2 or len(moves) > 0xFFFF: raise ValueError('Game too long to record')
+        if sys.byteorder != 'little': moves.byteswap()
+
+        offset = self.file.tell()
+        self.file.write(GAME_HEADER.pack(len(moves), RESULTS.index(result), len(FEN)))
+        self.file.write(FEN.encode('ascii'))
+        self.file.write(moves.tobytes())
+        self.file.flush()
+        return offset
+
+    def begin(self, FEN=None):
+        """Start recording a new game. """
+        self.FEN = FEN
+        self.moves = array('H')
+
+    def append(self, move):
+        """Record the next move of the game being recorded. """
+        self.moves.append(move)
+
+    def finish(self, result='*'):
+        """Write the game being recorded and return its offset. """
+        offset = self.write_game(self.FEN, self.moves, result)
+        self.begin()
+        return offset
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class GameReader:
+    """Read games out of a game file through a memory map, without loading the file.
+
+        Opening the file only walks the game headers, skipping over the moves, to find where
+        each game starts. A game's moves are only decoded when that game is asked for.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('Not a game file')
+        self._offsets = None
+
+    @property
+    def offsets(self):
+        """Return the offset of every game in the file. """
+        if self._offsets is None:
+            offsets = []
+            offset = FILE_HEADER.size
+            size = len(self.map)
+            while offset < size:
+                offsets.append(offset)
+                count, result, FEN_length = GAME_HEADER.unpack_from(self.map, offset)
+                offset += GAME_HEADER.size + FEN_length + count * 2
+            self._offsets = offsets
+        return self._offsets
+
+    def game_at(self, offset):
+        """Decode the game starting at an offset. """
+        count, result, FEN_length = GAME_HEADER.unpack_from(self.map, offset)
+        start = offset + GAME_HEADER.size
+        FEN = self.map[start:start + FEN_length].decode('ascii')
+        moves = array('H', self.map[start + FEN_length:start + FEN_length + count * 2])
+        if sys.byteorder != 'little': moves.byteswap()
+        return Game(FEN, moves, RESULTS[result], offset)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, n):
+        return self.game_at(self.offsets[n])
+
+    def __iter__(self):
+        for offset in self.offsets:
+            yield self.game_at(offset)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def move_san(position, move, legal=None):
+    """Return a legal move in standard algebraic notation, like Nbd7, exd6, e8=Q or O-O+. """
+    frm, to, promo = move & 63, move_to(move), move_promo(move)
+    squares = position.squares
+    code = squares[frm]
+    kind = code & 7
+
+    if kind == KING and abs(to - frm) == 2:
+        san = 'O-O' if to > frm else 'O-O-O'
+    elif kind == PAWN:
+        san = SQUARE_NAMES[to]
+        if squares[to] or to == position.ep: san = SQUARE_NAMES[frm][0] + 'x' + san
+        if promo: san += '=' + PIECE_TAGS[promo]
+    else:
+        # name the origin file, rank or both when another piece of the same kind could go there too
+        legal = position.legal_moves() if legal is None else legal
+        others = [m & 63 for m in legal if move_to(m) == to and m & 63 != frm and squares[m & 63] == code]
+        origin = ''
+        if others:
+            if all(n % 8 != frm % 8 for n in others): origin = SQUARE_NAMES[frm][0]
+            elif all(n // 8 != frm // 8 for n in others): origin = SQUARE_NAMES[frm][1]
+            else: origin = SQUARE_NAMES[frm]
+        san = PIECE_TAGS[kind] + origin + ('x' if squares[to] else '') + SQUARE_NAMES[to]
+
+    position.make_move(move)
+    if position.in_check(): san += '+' if position.has_legal_move() else '#'
+    position.unmake_move()
+    return san
+
+
+# piece, origin file, origin rank, target, promotion. lenient about a missing = or extra disambiguation
+SAN_PATTERN = re.compile(r'([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])=?([NBRQ])?')
+
+
+def parse_san(position, san):
+    """Return the legal move a SAN string names, raising ValueError if there is none or it is ambiguous. """
+    text = san.rstrip('+#!?').removesuffix('e.p.').rstrip('+#!?')
+    legal = position.legal_moves()
+    squares = position.squares
+
+    if text in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+        matches = [m for m in legal if squares[m & 63] & 7 == KING and move_to(m) - (m & 63) == (2 if len(text) == 3 else -2)]
+    else:
+        match = SAN_PATTERN.fullmatch(text)
+        if not match: raise ValueError(f'Illegal move: {san}')
+        piece, file, rank, to, promo = match.groups()
+        kind = PIECE_CODES[piece] if piece else PAWN
+        to = SQUARE_NAMES.index(to)
+        promo = PIECE_CODES[promo] if promo else 0
+        matches = [m for m in legal if move_to(m) == to and squares[m & 63] & 7 == kind and move_promo(m) == promo
+                   and (not file or SQUARE_NAMES[m & 63][0] == file) and (not rank or SQUARE_NAMES[m & 63][1] == rank)]
+
+    if len(matches) != 1: raise ValueError(f'Illegal move: {san}' if not matches else f'Ambiguous move: {san}')
+    return matches[0]
+
+
+def export_pgn(game, tags=None):
+    """Return a game as PGN text. """
+    roster = {'Event': '?', 'Site': '?', 'Date': '????.??.??', 'Round': '?', 'White': '?', 'Black': '?'}
+    roster.update(game.tags)
+    roster.update(tags or {})
+    roster['Result'] = game.result
+    if game.FEN != START_FEN:
+        roster['SetUp'] = '1'
+        roster['FEN'] = game.FEN
+    lines = [f'[{name} "{value}"]' for name, value in roster.items()]
+
+    words = []
+    position = parse_FEN(game.FEN)
+    for n, move in enumerate(game.moves):
+        if position.tomove == WHITE: words.append(f'{position.fullmoves}.')
+        elif n == 0: words.append(f'{position.fullmoves}...')
+        words.append(move_san(position, move))
+        position.make_move(move)
+    words.append(game.result)
+
+    # movetext is wrapped at 80 columns
+    movetext = []
+    line = ''
+    for word in words:
+        if line and len(line) + len(word) >= 80:
+            movetext.append(line)
+            line = word
+        else:
+            line = f'{line} {word}' if line else word
+    movetext.append(line)
+
+    return '\n'.join(lines) + '\n\n' + '\n'.join(movetext) + '\n'
+
+
+PGN_TOKENS = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]'  # tag pair
+                        r'|\{[^}]*\}|;[^\n]*|\$\d+'  # comments and NAGs
+                        r'|(\()|(\))'  # variations
+                        r'|(1-0|0-1|1/2-1/2|\*)'  # results
+                        r'|\d+\.+'  # move numbers
+                        r'|([^\s{}();\[\]]+)')  # everything else is a move
+
+
+def import_pgn(source):
+    """Yield a Game for every game in PGN text or an open PGN file. Variations and comments are skipped.
+
+        A game with a move or FEN that can't be read is reported on stderr and left out, and
+        importing carries on with the next game.
+    """
+    if hasattr(source, 'read'): source = source.read()
+
+    tags = {}
+    position = None
+    game = None
+    count = 0  # games read so far, to say which one was skipped
+    broken = False  # passing over the rest of a skipped game
+    depth = 0  # how many variations deep the parser is
+
+    for match in PGN_TOKENS.finditer(source):
+        name, value, opening, closing, result, san = match.groups()
+        if name:
+            if game is not None and game.moves:
+                yield game  # a game with no result token ran into the next one's tags
+                game = None
+            broken = False
+            tags[name] = value
+        elif opening: depth += 1
+        elif closing: depth -= 1
+        elif depth or san == 'e.p.': continue  # e.p. can come apart from its move
+        elif broken: broken = not result
+        elif result or san:
+            try:
+                if game is None:
+                    count += 1
+                    game = Game(tags.get('FEN'))
+                    game.tags = tags
+                    tags = {}
+                    position = parse_FEN(game.FEN)
+                if san:
+                    move = parse_san(position, san)
+                    position.make_move(move)
+                    game.moves.append(move)
+            except ValueError as e:
+                print(f'Skipping game {count} ({game.tags.get("White", "?")} - {game.tags.get("Black", "?")}): {e}',
+                      file=sys.stderr)
+                game = None
+                broken = not result
+                continue
+
+            if result:
+                game.result = result
+                yield game
+                game = None
+
+    if game is not None and game.moves: yield game
+
+
+def build_index(games_path, index_path):
+    """Write an index from every position key in a game file to the offsets of the games reaching it. """
+    entries = []
+    with GameReader(games_path) as reader:
+        for game in reader:
+            # a game that goes back to a position is still only one game to find
+            entries.extend((key, game.offset) for key in set(game.keys()))
+    entries.sort()
+
+    with open(index_path, 'wb') as f:
+        for entry in entries:
+            f.write(INDEX_ENTRY.pack(*entry))
+    return len(entries)
+
+
+class PositionIndex:
+    """Look up the games that reached a position in an index file, by binary search over a memory map. """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.size = 0
+        self.map = None
+        if self.file.seek(0, 2):
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.size = len(self.map) // INDEX_ENTRY.size
+
+    def key_at(self, n):
+        return INDEX_ENTRY.unpack_from(self.map, n * INDEX_ENTRY.size)[0]
+
+    def games_with(self, key):
+        """Return the offsets of every game that reached the position with the given key. """
+        n = bisect_left(range(self.size), key, key=self.key_at)
+        offsets = []
+        while n < self.size:
+            entry_key, offset = INDEX_ENTRY.unpack_from(self.map, n * INDEX_ENTRY.size)
+            if entry_key != key: break
+            offsets.append(offset)
+            n += 1
+        return offsets
+
+    def close(self):
+        if self.map: self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
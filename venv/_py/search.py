@@ -0,0 +1,366 @@
+# Search engine: negamax alpha-beta with iterative deepening, quiescence and a transposition table
+from array import array
+from time import perf_counter
+
+from pieces import Pawn, Knight, Bishop, Rook, Queen, King
+from position import *
+
+# material comes from the Pieces themselves, in centipawns
+PIECE_VALUES = [0] + [piece(0, 'w').value * 100 for piece in (Pawn, Knight, Bishop, Rook, Queen, King)]
+
+INFINITY = 32000
+MATE = 31000  # mate scores are MATE minus the distance to mate in plies
+MAX_PLY = 64
+
+# piece-square bonuses from white's point of view, laid out like the board: a8 first, h1 last.
+# black pieces read them mirrored with sq ^ 56
+PIECE_SQUARES = [None] * 7
+PIECE_SQUARES[PAWN] = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+)
+PIECE_SQUARES[KNIGHT] = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50,
+)
+PIECE_SQUARES[BISHOP] = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20,
+)
+PIECE_SQUARES[ROOK] = (
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0,
+)
+PIECE_SQUARES[QUEEN] = (
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+)
+PIECE_SQUARES[KING] = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20,
+)
+# once the heavy pieces are gone the king should walk to the middle instead
+KING_ENDGAME_SQUARES = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50,
+)
+ENDGAME_MATERIAL = 1300  # non-pawn material per side at or under which the endgame king table is used
+
+# transposition table entry bounds
+EXACT, LOWER, UPPER = 1, 2, 3
+
+
+def evaluate(position):
+    """Return a static score of the position in centipawns, from the side to move's point of view. """
+    bb = position.bb
+    score = 0
+    material = [0, 0]
+
+    for kind in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN):
+        value = PIECE_VALUES[kind]
+        table = PIECE_SQUARES[kind]
+        for sq in squares_of(bb[kind]):
+            score += value + table[sq]
+        for sq in squares_of(bb[kind | BLACKBIT]):
+            score -= value + table[sq ^ 56]
+        if kind != PAWN:
+            material[WHITE] += value * bb[kind].bit_count()
+            material[BLACK] += value * bb[kind | BLACKBIT].bit_count()
+
+    endgame = max(material) <= ENDGAME_MATERIAL
+    table = KING_ENDGAME_SQUARES if endgame else PIECE_SQUARES[KING]
+    if bb[KING]: score += table[lsb(bb[KING])]
+    if bb[KING | BLACKBIT]: score -= table[lsb(bb[KING | BLACKBIT]) ^ 56]
+
+    return score if position.tomove == WHITE else -score
+
+
+class TranspositionTable:
+    """Store search results in a fixed number of slots, indexed by the low bits of the zobrist key.
+
+        Every slot is two 64-bit words in flat arrays, the full key and the packed entry, so
+        the table never grows past the memory it was given. A slot is overwritten when it is
+        empty, holds the same position, comes from an older search, or was searched no deeper
+        than the new result. Otherwise the deeper result from this search is kept.
+    """
+
+    def __init__(self, megabytes=16):
+        # round down to a power of two so a mask can index it
+        slots = max(1, (megabytes << 20) // 16)
+        self.size = 1 << (slots.bit_length() - 1)
+        self.mask = self.size - 1
+        self.keys = array('Q', bytes(8 * self.size))
+        self.data = array('Q', bytes(8 * self.size))
+        self.age = 0
+
+    def clear(self):
+        """Empty every slot. """
+        self.keys = array('Q', bytes(8 * self.size))
+        self.data = array('Q', bytes(8 * self.size))
+        self.age = 0
+
+    def new_search(self):
+        """Age the table, so entries from earlier searches are replaced first. """
+        self.age = (self.age + 1) & 63
+
+    def probe(self, key):
+        """Return (depth, score, bound, move) stored for a key, or None. """
+        index = key & self.mask
+        data = self.data[index]
+        if not data or self.keys[index] != key: return None
+        # packed as move 0-15, score + 32768 16-31, depth 32-39, bound 40-41, age 42-47
+        return (data >> 32) & 255, ((data >> 16) & 0xFFFF) - 32768, (data >> 40) & 3, data & 0xFFFF
+
+    def store(self, key, depth, score, bound, move):
+        """Store a search result, following the replacement policy. """
+        index = key & self.mask
+        old = self.data[index]
+        if old and self.keys[index] != key and old >> 42 == self.age and (old >> 32) & 255 > depth:
+            return
+        if not move and old and self.keys[index] == key:
+            move = old & 0xFFFF  # keep the best move we already knew about
+
+        self.keys[index] = key
+        self.data[index] = move | ((score + 32768) << 16) | (min(depth, 255) << 32) | (bound << 40) | (self.age << 42)
+
+    def hashfull(self):
+        """Return how full the table is in permille, sampled from the first thousand slots. """
+        sample = min(1000, self.size)
+        return sum(1 for n in range(sample) if self.data[n] and self.data[n] >> 42 == self.age) * 1000 // sample
+
+
+class Search:
+    """Find the best move in a position, within a depth, node or wall-clock budget.
+
+        The search plays moves straight on the Position with make_move/unmake_move, so the
+        position handed in is left as it was once search returns.
+    """
+
+    def __init__(self, megabytes=16):
+        self.tt = TranspositionTable(megabytes)
+        self.position = None
+        self.stopped = False
+        self.nodes = 0
+        self.start = 0
+        self.deadline = None
+        self.node_limit = None
+        self.killers = [[0, 0] for n in range(MAX_PLY)]
+        self.history = [[0] * 4096, [0] * 4096]  # per color, indexed by origin and target
+        self.root_best = 0
+
+    def stop(self):
+        """Ask a running search to return as soon as possible. Safe to call from another thread. """
+        self.stopped = True
+
+    def search(self, position, depth=None, movetime=None, nodes=None, report=None):
+        """Search a position and return the best move found, or 0 if there is no legal move.
+
+            depth caps the iterative deepening, movetime is a budget in seconds and nodes a
+            budget in nodes. When a budget runs out the best move found so far is returned.
+            report, if given, is called after every finished iteration with
+            (depth, score, nodes, seconds, pv).
+        """
+        self.position = position
+        self.stopped = False
+        self.nodes = 0
+        self.start = perf_counter()
+        self.deadline = self.start + movetime if movetime else None
+        self.node_limit = nodes
+        self.killers = [[0, 0] for n in range(MAX_PLY)]
+        self.history = [[0] * 4096, [0] * 4096]
+        self.tt.new_search()
+
+        moves = position.legal_moves()
+        if not moves: return 0
+        best = moves[0]
+        if len(moves) == 1: return best  # nothing to think about
+
+        max_depth = min(depth or MAX_PLY, MAX_PLY - 1)
+        for n in range(1, max_depth + 1):
+            self.root_best = 0
+            score = self.negamax(n, -INFINITY, INFINITY, 0)
+            # an interrupted iteration still searched its first moves fully, so a root move it found is fine to use
+            if self.root_best: best = self.root_best
+            if self.stopped: break
+            if report: report(n, score, self.nodes, perf_counter() - self.start, self.principal_variation(n))
+            if abs(score) >= MATE - n: break  # a forced mate won't get any shorter by looking deeper
+
+        self.stopped = True
+        return best
+
+    def check_limits(self):
+        """Flag the search as stopped if it has run out of nodes or time. """
+        if self.node_limit and self.nodes >= self.node_limit:
+            self.stopped = True
+        # the clock is only read every 1024 nodes, it costs more than a node does
+        elif self.deadline and not self.nodes & 1023 and perf_counter() >= self.deadline:
+            self.stopped = True
+
+    def negamax(self, depth, alpha, beta, ply):
+        """Return the score of the position to the given depth, within the alpha-beta window. """
+        position = self.position
+        self.nodes += 1
+        self.check_limits()
+        if self.stopped: return 0
+
+        if ply and (position.halfmoves >= 100 or position.is_repetition()): return 0
+        in_check = position.in_check()
+        if in_check: depth += 1  # never stop searching while in check
+        if depth <= 0 or ply >= MAX_PLY - 1: return self.quiesce(alpha, beta, ply)
+
+        key = position.key
+        entry = self.tt.probe(key)
+        tt_move = 0
+        if entry:
+            tt_depth, tt_score, bound, tt_move = entry
+            if ply and tt_depth >= depth:
+                tt_score = self.score_from_tt(tt_score, ply)
+                if bound == EXACT: return tt_score
+                if bound == LOWER and tt_score >= beta: return tt_score
+                if bound == UPPER and tt_score <= alpha: return tt_score
+
+        moves = position.legal_moves()
+        if not moves: return -MATE + ply if in_check else 0
+
+        original_alpha = alpha
+        best_score, best_move = -INFINITY, 0
+        squares = position.squares
+        for move in self.order_moves(moves, tt_move, ply):
+            position.make_move(move)
+            score = -self.negamax(depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move()
+            if self.stopped: return 0
+
+            if score > best_score:
+                best_score, best_move = score, move
+                if not ply: self.root_best = move
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    # quiet moves that cut off are worth trying first elsewhere in the tree
+                    if not squares[move_to(move)] and not move_promo(move):
+                        killers = self.killers[ply]
+                        if killers[0] != move: killers[0], killers[1] = move, killers[0]
+                        self.history[position.tomove][move & 4095] += depth * depth
+                    break
+
+        if best_score <= original_alpha: bound = UPPER
+        elif best_score >= beta: bound = LOWER
+        else: bound = EXACT
+        self.tt.store(key, depth, self.score_to_tt(best_score, ply), bound, best_move)
+        return best_score
+
+    def quiesce(self, alpha, beta, ply):
+        """Search captures and promotions only, until the position is quiet. """
+        position = self.position
+        self.nodes += 1
+        self.check_limits()
+        if self.stopped: return 0
+
+        # standing pat: the side to move can usually do at least as well as doing nothing
+        score = evaluate(position)
+        if score >= beta or ply >= MAX_PLY - 1: return score
+        if score > alpha: alpha = score
+
+        squares = position.squares
+        ep = position.ep
+        captures = [move for move in position.legal_moves()
+                    if squares[move_to(move)] or move_promo(move) or (move_to(move) == ep and squares[move & 63] & 7 == PAWN)]
+        for move in self.order_moves(captures, 0, ply):
+            position.make_move(move)
+            score = -self.quiesce(-beta, -alpha, ply + 1)
+            position.unmake_move()
+            if self.stopped: return 0
+
+            if score >= beta: return score
+            if score > alpha: alpha = score
+        return alpha
+
+    def order_moves(self, moves, tt_move, ply):
+        """Sort moves best first: the table move, captures by MVV-LVA, promotions, killers, then history. """
+        squares = self.position.squares
+        killers = self.killers[ply]
+        history = self.history[self.position.tomove]
+
+        def priority(move):
+            if move == tt_move: return 1 << 30
+            victim = squares[move_to(move)]
+            if victim:
+                # most valuable victim first, least valuable attacker breaking ties
+                return (1 << 24) + PIECE_VALUES[victim & 7] * 16 - (squares[move & 63] & 7)
+            if move_promo(move): return (1 << 23) + PIECE_VALUES[move_promo(move)]
+            if move == killers[0]: return 1 << 22
+            if move == killers[1]: return 1 << 21
+            return min(history[move & 4095], (1 << 21) - 1)
+
+        moves.sort(key=priority, reverse=True)
+        return moves
+
+    def principal_variation(self, depth):
+        """Return the expected line of play, following best moves through the table. """
+        position = self.position
+        pv = []
+        for n in range(depth):
+            entry = self.tt.probe(position.key)
+            if not entry or entry[3] not in position.legal_moves(): break
+            pv.append(entry[3])
+            position.make_move(entry[3])
+        for move in pv:
+            position.unmake_move()
+        return pv
+
+    @staticmethod
+    def score_to_tt(score, ply):
+        """Store mate scores as distance from this node rather than from the root. """
+        if score >= MATE - MAX_PLY: return score + ply
+        if score <= -MATE + MAX_PLY: return score - ply
+        return score
+
+    @staticmethod
+    def score_from_tt(score, ply):
+        """Turn a stored mate score back into distance from the root. """
+        if score >= MATE - MAX_PLY: return score - ply
+        if score <= -MATE + MAX_PLY: return score + ply
+        return score
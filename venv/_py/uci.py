@@ -0,0 +1,198 @@
+# UCI front end: commands are read on the asyncio loop while the search runs on a worker thread
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from fen import parse_FEN
+from position import move_name, WHITE
+from probe import DEFAULT_BOOK, DEFAULT_TABLES, OpeningBook, Probe
+from record import START_FEN
+from search import Search, MATE, MAX_PLY
+
+NAME = 'silly-little-console-chess'
+AUTHOR = 'robopng'
+DEFAULT_HASH = 16
+MAX_HASH = 1024
+MOVE_OVERHEAD = 50  # milliseconds kept back from the clock for the GUI and the pipe
+MOVES_TO_GO = 30  # moves the clock is assumed to cover when the GUI doesn't say
+
+
+def parse_move(position, text):
+    """Return the legal move a long algebraic string like e2e4 or e7e8q names, raising ValueError if there is none. """
+    for move in position.legal_moves():
+        if move_name(move) == text: return move
+    raise ValueError(f'Illegal move: {text}')
+
+
+def score_name(score):
+    """Return a search score the way UCI reports it, in centipawns or moves to mate. """
+    if score >= MATE - MAX_PLY: return f'mate {(MATE - score + 1) // 2}'
+    if score <= -MATE + MAX_PLY: return f'mate -{(MATE + score) // 2}'
+    return f'cp {score}'
+
+
+class UCI:
+    """Speak UCI over stdin/stdout.
+
+        Reading stdin never waits on the search: lines are read on the event loop while
+        the search runs on its own thread, so stop and isready are answered mid-search.
+    """
+
+    def __init__(self, megabytes=DEFAULT_HASH, output=None):
+        self.search = Search(megabytes)
+        self.probe = Probe()
+        self.position = parse_FEN(START_FEN)
+        self.output = output or sys.stdout
+        self.lock = threading.Lock()  # info lines come from the search thread, everything else from the loop
+        self.worker = ThreadPoolExecutor(1)
+        self.thinking = None  # the task waiting on the running search
+        self.released = None  # set once a go infinite search may send its bestmove
+
+    def send(self, line):
+        with self.lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    async def run(self, lines=()):
+        """Handle commands until quit or the end of stdin. lines are handled first, if already read. """
+        loop = asyncio.get_running_loop()
+        lines = list(lines)
+        while True:
+            line = lines.pop(0) if lines else await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                # stdin ran out, let the last search finish on its own instead of cutting it short
+                if self.thinking:
+                    self.released.set()
+                    await self.thinking
+                break
+            if not await self.handle(line): break
+        await self.finish()
+        self.worker.shutdown()
+
+    async def handle(self, line):
+        """Handle one command. Returns False on quit. """
+        words = line.split()
+        if not words: return True
+        command, args = words[0], words[1:]
+
+        if command == 'uci':
+            self.send(f'id name {NAME}')
+            self.send(f'id author {AUTHOR}')
+            self.send(f'option name Hash type spin default {DEFAULT_HASH} min 1 max {MAX_HASH}')
+            self.send(f'option name Book type string default {DEFAULT_BOOK}')
+            self.send(f'option name Tables type string default {DEFAULT_TABLES}')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'ucinewgame':
+            await self.finish()
+            self.search.tt.clear()
+        elif command == 'setoption':
+            await self.finish()
+            self.set_option(args)
+        elif command == 'position':
+            self.set_position(args)
+        elif command == 'go':
+            await self.finish()
+            self.go(args)
+        elif command == 'stop':
+            await self.finish()
+        elif command == 'quit':
+            return False
+        # anything else, ponderhit included, is ignored like the protocol asks
+        return True
+
+    def set_option(self, args):
+        text = ' '.join(args)
+        name, _, value = text.partition(' value ')
+        name, value = name.removeprefix('name ').strip().lower(), value.strip()
+        if name == 'hash' and value.isdigit():
+            self.search = Search(min(max(int(value), 1), MAX_HASH))
+        elif name == 'book':
+            self.probe.book.close()
+            self.probe.book = OpeningBook(value)
+        elif name == 'tables':
+            self.probe.close()
+            self.probe.directory = value
+
+    def set_position(self, args):
+        """Set the position from position [startpos | fen <FEN>] [moves <move> ...]. """
+        if 'moves' in args:
+            split = args.index('moves')
+            args, moves = args[:split], args[split + 1:]
+        else:
+            moves = []
+
+        try:
+            # a fresh Position, the search thread may still be looking at the old one
+            if args[:1] == ['fen']: position = parse_FEN(' '.join(args[1:]))
+            else: position = parse_FEN(START_FEN)
+            for text in moves:
+                position.make_move(parse_move(position, text))
+        except (ValueError, IndexError) as e:
+            self.send(f'info string {e}')
+            return
+        self.position = position
+
+    def go(self, args):
+        """Start searching the current position on the worker thread. """
+        limits = {}
+        for name, value in zip(args, args[1:]):
+            if value.lstrip('-').isdigit(): limits[name] = int(value)
+
+        movetime = None
+        if 'movetime' in limits:
+            movetime = limits['movetime'] / 1000
+        elif 'wtime' in limits or 'btime' in limits:
+            white = self.position.tomove == WHITE
+            clock = limits.get('wtime' if white else 'btime', 0)
+            increment = limits.get('winc' if white else 'binc', 0)
+            budget = clock / limits.get('movestogo', MOVES_TO_GO) + increment * 3 / 4
+            # never plan to use more than is left on the clock, but always look at least a little
+            movetime = max(min(budget, clock - MOVE_OVERHEAD), 10) / 1000
+
+        self.released = asyncio.Event()
+        if 'infinite' not in args:
+            self.released.set()
+            # book and table moves go straight out, analysis still searches
+            move = self.probe.choose(self.position)
+            if move:
+                self.send(f'info string probe hit, book {self.probe.book_hits} tables {self.probe.table_hits}')
+                self.send(f'bestmove {move_name(move)}')
+                return
+        search = partial(self.search.search, self.position, limits.get('depth'), movetime, limits.get('nodes'),
+                         self.report)
+        self.thinking = asyncio.create_task(self.think(search))
+
+    async def think(self, search):
+        move = await asyncio.get_running_loop().run_in_executor(self.worker, search)
+        # go infinite may only answer once stop comes, even if the search ran out of things to do
+        await self.released.wait()
+        self.send(f'bestmove {move_name(move) if move else "0000"}')
+
+    async def finish(self):
+        """Stop the running search, if any, and wait for its bestmove to go out. """
+        if self.thinking is None: return
+        self.released.set()
+        while not self.thinking.done():
+            # the flag is reset when a search starts, so keep setting it until the thread has seen it
+            self.search.stop()
+            await asyncio.wait({self.thinking}, timeout=0.01)
+        self.thinking = None
+
+    def report(self, depth, score, nodes, seconds, pv):
+        """Send an info line for a finished iteration. Called on the search thread. """
+        milliseconds = int(seconds * 1000)
+        nps = int(nodes / seconds) if seconds > 0 else 0
+        self.send(f'info depth {depth} score {score_name(score)} nodes {nodes} nps {nps} time {milliseconds} '
+                  f'hashfull {self.search.tt.hashfull()} pv {" ".join(move_name(move) for move in pv)}')
+
+
+def main(lines=()):
+    asyncio.run(UCI().run(lines))
+
+
+if __name__ == '__main__':
+    main()